@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 # Copyright (c) 2023-2025, Songlin Yang, Yu Zhang
 
+import functools
 from typing import Optional, Tuple
 
 import torch
@@ -8,6 +9,24 @@ import triton
 import triton.language as tl
 
 from fla.ops.common.utils import prepare_chunk_offsets
+from fla.ops.utils.exp import safe_exp
+
+
+@functools.lru_cache(maxsize=64)
+def get_block_sizes(K: int, BT: int, device: int, backward: bool = False) -> Tuple[int, int]:
+    # the block sizes only depend on the head dim, chunk size and device,
+    # so they are cached to save the host-side overhead of repeated (short) calls
+    BK = triton.next_power_of_2(K)
+    capability = torch.cuda.get_device_capability(device)
+    # H100 can have larger block size
+    if capability[0] >= 9:
+        BC = 64
+    # A100
+    elif capability == (8, 0):
+        BC = 64 if K <= 128 or not backward else 32
+    else:
+        BC = 64 if K <= 128 else 32
+    return BK, min(BT, BC)
 
 
 @triton.heuristics({
@@ -18,10 +37,15 @@ from fla.ops.common.utils import prepare_chunk_offsets
 })
 @triton.autotune(
     configs=[
-        triton.Config({}, num_warps=num_warps)
+        triton.Config({'BV': BV}, num_warps=num_warps, num_stages=num_stages)
+        for BV in [16, 32, 64]
         for num_warps in [2, 4, 8, 16]
+        for num_stages in [2, 3, 4]
+        # narrow tiles leave too little work for many warps, which would only add compile time to the first call
+        if num_warps <= BV // 4
     ],
-    key=['BT', 'BK', 'BV', 'USE_G'],
+    # NG buckets the number of programs along the sequence/head axis, so that small grids can pick narrower BV tiles
+    key=['BT', 'BC', 'K', 'V', 'NG', 'USE_G'],
 )
 @triton.jit
 def chunk_gated_delta_rule_fwd_kernel_h(
@@ -35,6 +59,7 @@ def chunk_gated_delta_rule_fwd_kernel_h(
     ht,
     offsets,
     chunk_offsets,
+    NG,
     T: tl.constexpr,
     H: tl.constexpr,
     K: tl.constexpr,
@@ -62,57 +87,89 @@ def chunk_gated_delta_rule_fwd_kernel_h(
         NT = tl.cdiv(T, BT)
         boh = i_n * NT
 
+    # offset calculation
+    # h is laid out as [B, H, NT, K, V] or [B, NT, H, K, V], i.e., the chunks are separated by a stride of s_h
+    s_h = K*V if HEAD_FIRST else H*K*V
+    h += ((i_nh * NT) if HEAD_FIRST else (boh * H + i_h)).to(tl.int64) * K*V
+    k += (i_nh * T*K) if HEAD_FIRST else ((bos * H + i_h) * K)
+    d += (i_nh * T*K) if HEAD_FIRST else ((bos * H + i_h) * K)
+    v += (i_nh * T*V) if HEAD_FIRST else ((bos * H + i_h) * V)
+    v_new += (i_nh * T*V) if HEAD_FIRST else ((bos * H + i_h) * V)
+    s_k = K if HEAD_FIRST else H*K
+    s_v = V if HEAD_FIRST else H*V
+    s_g = 1 if HEAD_FIRST else H
+    if USE_G:
+        g += (i_nh * T) if HEAD_FIRST else (bos * H + i_h)
+
     # [BK, BV]
     b_h = tl.zeros([BK, BV], dtype=tl.float32)
     if USE_INITIAL_STATE:
         p_h0 = tl.make_block_ptr(h0 + i_nh * K*V, (K, V), (V, 1), (i_k * BK, i_v * BV), (BK, BV), (1, 0))
         b_h = tl.load(p_h0, boundary_check=(0, 1)).to(tl.float32)
+    if BC == BT:
+        # the block pointers are moved forward chunk by chunk rather than rebuilt
+        p_k = tl.make_block_ptr(k, (K, T), (1, s_k), (i_k * BK, 0), (BK, BT), (0, 1))
+        p_d = tl.make_block_ptr(d, (T, K), (s_k, 1), (0, i_k * BK), (BT, BK), (1, 0))
+        p_v = tl.make_block_ptr(v, (T, V), (s_v, 1), (0, i_v * BV), (BT, BV), (1, 0))
+        p_v_new = tl.make_block_ptr(v_new, (T, V), (s_v, 1), (0, i_v * BV), (BT, BV), (1, 0))
+        p_g = tl.make_block_ptr(g, (T,), (s_g,), (0,), (BT,), (0,)) if USE_G else None
 
     for i_t in range(NT):
-        if HEAD_FIRST:
-            p_h = tl.make_block_ptr(h + (i_nh * NT + i_t) * K*V, (K, V), (V, 1), (i_k * BK, i_v * BV), (BK, BV), (1, 0))
-        else:
-            p_h = tl.make_block_ptr(h + ((boh + i_t) * H + i_h) * K*V, (K, V), (V, 1), (i_k * BK, i_v * BV), (BK, BV), (1, 0))
+        p_h = tl.make_block_ptr(h + i_t.to(tl.int64) * s_h, (K, V), (V, 1), (i_k * BK, i_v * BV), (BK, BV), (1, 0))
         tl.store(p_h, b_h.to(p_h.dtype.element_ty), boundary_check=(0, 1))
-        b_hc = tl.zeros([BK, BV], dtype=tl.float32)
         if USE_G:
             last_idx = min((i_t + 1) * BT, T) - 1
-            if HEAD_FIRST:
-                b_g_last = tl.load(g + i_nh * T + last_idx)
-            else:
-                b_g_last = tl.load(g + bos * H + last_idx * H + i_h)
+            b_g_last = tl.load(g + last_idx * s_g)
         else:
             b_g_last = None
             last_idx = None
-        # since we need to make all DK in the SRAM. we face serve SRAM memory burden. By subchunking we allievate such burden
-        for i_c in range(tl.cdiv(min(BT, T - i_t * BT), BC)):
-            if HEAD_FIRST:
-                p_k = tl.make_block_ptr(k + i_nh * T*K, (K, T), (1, K), (i_k * BK, i_t * BT + i_c * BC), (BK, BC), (0, 1))
-                p_d = tl.make_block_ptr(d + i_nh * T*K, (T, K), (K, 1), (i_t * BT + i_c * BC, i_k * BK), (BC, BK), (1, 0))
-                p_v = tl.make_block_ptr(v + i_nh * T*V, (T, V), (V, 1), (i_t * BT + i_c * BC, i_v * BV), (BC, BV), (1, 0))
-                p_v_new = tl.make_block_ptr(v_new+i_nh*T*V, (T, V), (V, 1), (i_t * BT + i_c * BC, i_v * BV), (BC, BV), (1, 0))
-                p_g = tl.make_block_ptr(g + i_nh * T, (T,), (1,), (i_t * BT + i_c * BC,), (BC,), (0,)) if USE_G else None
-            else:
-                p_k = tl.make_block_ptr(k+(bos*H+i_h)*K, (K, T), (1, H*K), (i_k * BK, i_t * BT + i_c * BC), (BK, BC), (0, 1))
-                p_d = tl.make_block_ptr(d+(bos*H+i_h)*K, (T, K), (H*K, 1), (i_t * BT + i_c * BC, i_k * BK), (BC, BK), (1, 0))
-                p_v = tl.make_block_ptr(v+(bos*H+i_h)*V, (T, V), (H*V, 1), (i_t * BT + i_c * BC, i_v * BV), (BC, BV), (1, 0))
-                p_v_new = tl.make_block_ptr(v_new+(bos*H+i_h)*V, (T, V), (H*V, 1), (i_t*BT+i_c*BC, i_v * BV), (BC, BV), (1, 0))
-                p_g = tl.make_block_ptr(g+bos*H+i_h, (T,), (H,), (i_t*BT+i_c*BC, ), (BC,), (0,)) if USE_G else None
+        if BC == BT:
+            # the chunk is processed as a whole, so the state can be updated in place without a temporary
             b_g = tl.load(p_g, boundary_check=(0, )) if USE_G else None
-            # [BK, BC]
+            # [BK, BT]
             b_k = tl.load(p_k, boundary_check=(0, 1))
             b_k = (b_k * tl.exp(b_g_last - b_g)[None, :]).to(b_k.dtype) if USE_G else b_k
-            # [BC, BK]
+            # [BT, BK]
             b_d = tl.load(p_d, boundary_check=(0, 1))
             b_d = (b_d * tl.exp(b_g)[:, None]).to(b_d.dtype) if USE_G else b_d
-            # [BC, BV]
+            # [BT, BV]
             b_v = tl.load(p_v, boundary_check=(0, 1))
             b_v2 = b_v - tl.dot(b_d, b_h.to(b_d.dtype))
-            # [BK, BV]
             tl.store(p_v_new, b_v2.to(p_v_new.dtype.element_ty), boundary_check=(0, 1))
-            b_hc += tl.dot(b_k, b_v2.to(b_k.dtype), allow_tf32=False)
-        b_h *= tl.exp(b_g_last) if USE_G else 1
-        b_h += b_hc
+            # [BK, BV]
+            if USE_G:
+                b_h *= tl.exp(b_g_last)
+                p_g = tl.advance(p_g, (BT,))
+            b_h = tl.dot(b_k, b_v2.to(b_k.dtype), acc=b_h, allow_tf32=False)
+            p_k = tl.advance(p_k, (0, BT))
+            p_d = tl.advance(p_d, (BT, 0))
+            p_v = tl.advance(p_v, (BT, 0))
+            p_v_new = tl.advance(p_v_new, (BT, 0))
+        else:
+            b_hc = tl.zeros([BK, BV], dtype=tl.float32)
+            # since we need to make all DK in the SRAM. we face severe SRAM memory burden.
+            # By subchunking we alleviate such burden
+            for i_c in range(tl.cdiv(min(BT, T - i_t * BT), BC)):
+                p_k = tl.make_block_ptr(k, (K, T), (1, s_k), (i_k * BK, i_t * BT + i_c * BC), (BK, BC), (0, 1))
+                p_d = tl.make_block_ptr(d, (T, K), (s_k, 1), (i_t * BT + i_c * BC, i_k * BK), (BC, BK), (1, 0))
+                p_v = tl.make_block_ptr(v, (T, V), (s_v, 1), (i_t * BT + i_c * BC, i_v * BV), (BC, BV), (1, 0))
+                p_v_new = tl.make_block_ptr(v_new, (T, V), (s_v, 1), (i_t * BT + i_c * BC, i_v * BV), (BC, BV), (1, 0))
+                p_g = tl.make_block_ptr(g, (T,), (s_g,), (i_t * BT + i_c * BC,), (BC,), (0,)) if USE_G else None
+                b_g = tl.load(p_g, boundary_check=(0, )) if USE_G else None
+                # [BK, BC]
+                b_k = tl.load(p_k, boundary_check=(0, 1))
+                b_k = (b_k * tl.exp(b_g_last - b_g)[None, :]).to(b_k.dtype) if USE_G else b_k
+                # [BC, BK]
+                b_d = tl.load(p_d, boundary_check=(0, 1))
+                b_d = (b_d * tl.exp(b_g)[:, None]).to(b_d.dtype) if USE_G else b_d
+                # [BC, BV]
+                b_v = tl.load(p_v, boundary_check=(0, 1))
+                b_v2 = b_v - tl.dot(b_d, b_h.to(b_d.dtype))
+                # [BK, BV]
+                tl.store(p_v_new, b_v2.to(p_v_new.dtype.element_ty), boundary_check=(0, 1))
+                b_hc = tl.dot(b_k, b_v2.to(b_k.dtype), acc=b_hc, allow_tf32=False)
+            b_h *= tl.exp(b_g_last) if USE_G else 1
+            b_h += b_hc
 
     if STORE_FINAL_STATE:
         p_ht = tl.make_block_ptr(ht + i_nh * K*V, (K, V), (V, 1), (i_k * BK, i_v * BV), (BK, BV), (1, 0))
@@ -127,10 +184,15 @@ def chunk_gated_delta_rule_fwd_kernel_h(
 })
 @triton.autotune(
     configs=[
-        triton.Config({}, num_warps=num_warps)
+        triton.Config({'BV': BV}, num_warps=num_warps, num_stages=num_stages)
+        for BV in [16, 32, 64]
         for num_warps in [2, 4, 8, 16]
+        for num_stages in [2, 3, 4]
+        # narrow tiles leave too little work for many warps, which would only add compile time to the first call
+        if num_warps <= BV // 4
     ],
-    key=['BT', 'BK', 'BV', 'USE_G'],
+    # NG buckets the number of programs along the sequence/head axis, so that small grids can pick narrower BV tiles
+    key=['BT', 'BC', 'K', 'V', 'NG', 'USE_G'],
 )
 @triton.jit
 def chunk_gated_delta_rule_bwd_kernel_dhu(
@@ -143,10 +205,10 @@ def chunk_gated_delta_rule_bwd_kernel_dhu(
     do,
     dh,
     dv,
-    dv2,
     offsets,
     chunk_offsets,
     scale,
+    NG,
     T: tl.constexpr,
     H: tl.constexpr,
     K: tl.constexpr,
@@ -173,64 +235,135 @@ def chunk_gated_delta_rule_bwd_kernel_dhu(
         NT = tl.cdiv(T, BT)
         boh = i_n * NT
 
+    # offset calculation
+    s_h = K*V if HEAD_FIRST else H*K*V
+    dh += ((i_nh * NT) if HEAD_FIRST else (boh * H + i_h)).to(tl.int64) * K*V
+    q += (i_nh * T*K) if HEAD_FIRST else ((bos * H + i_h) * K)
+    k += (i_nh * T*K) if HEAD_FIRST else ((bos * H + i_h) * K)
+    d += (i_nh * T*K) if HEAD_FIRST else ((bos * H + i_h) * K)
+    do += (i_nh * T*V) if HEAD_FIRST else ((bos * H + i_h) * V)
+    dv += (i_nh * T*V) if HEAD_FIRST else ((bos * H + i_h) * V)
+    s_k = K if HEAD_FIRST else H*K
+    s_v = V if HEAD_FIRST else H*V
+    s_g = 1 if HEAD_FIRST else H
+    if USE_G:
+        g += (i_nh * T) if HEAD_FIRST else (bos * H + i_h)
+
+    o_c = tl.arange(0, BC)
+    m_A = o_c[:, None] <= o_c[None, :]
     # [BK, BV]
     b_dh = tl.zeros([BK, BV], dtype=tl.float32)
     if USE_FINAL_STATE_GRADIENT:
         p_dht = tl.make_block_ptr(dht + i_nh * K*V, (K, V), (V, 1), (i_k * BK, i_v * BV), (BK, BV), (1, 0))
         b_dh += tl.load(p_dht, boundary_check=(0, 1))
+    if BC == BT:
+        # the block pointers start from the last chunk and are moved backward chunk by chunk
+        p_q = tl.make_block_ptr(q, (K, T), (1, s_k), (i_k * BK, (NT - 1) * BT), (BK, BT), (0, 1))
+        p_k = tl.make_block_ptr(k, (T, K), (s_k, 1), ((NT - 1) * BT, i_k * BK), (BT, BK), (1, 0))
+        p_d = tl.make_block_ptr(d, (K, T), (1, s_k), (i_k * BK, (NT - 1) * BT), (BK, BT), (0, 1))
+        p_do = tl.make_block_ptr(do, (T, V), (s_v, 1), ((NT - 1) * BT, i_v * BV), (BT, BV), (1, 0))
+        p_dv = tl.make_block_ptr(dv, (T, V), (s_v, 1), ((NT - 1) * BT, i_v * BV), (BT, BV), (1, 0))
+        p_g = tl.make_block_ptr(g, (T,), (s_g,), ((NT - 1) * BT,), (BT,), (0,)) if USE_G else None
 
     for i_t in range(NT - 1, -1, -1):
-        if HEAD_FIRST:
-            p_dh = tl.make_block_ptr(dh + (i_nh * NT + i_t) * K*V, (K, V), (V, 1), (i_k * BK, i_v * BV), (BK, BV), (1, 0))
-        else:
-            p_dh = tl.make_block_ptr(dh + ((boh+i_t) * H + i_h) * K*V, (K, V), (V, 1), (i_k * BK, i_v * BV), (BK, BV), (1, 0))
+        p_dh = tl.make_block_ptr(dh + i_t.to(tl.int64) * s_h, (K, V), (V, 1), (i_k * BK, i_v * BV), (BK, BV), (1, 0))
         tl.store(p_dh, b_dh.to(p_dh.dtype.element_ty), boundary_check=(0, 1))
-        b_dh_tmp = tl.zeros([BK, BV], dtype=tl.float32)
         if USE_G:
             last_idx = min((i_t + 1) * BT, T) - 1
-            if HEAD_FIRST:
-                bg_last = tl.load(g + i_nh * T + last_idx)
-            else:
-                bg_last = tl.load(g + (bos + last_idx) * H + i_h)
+            bg_last = tl.load(g + last_idx * s_g)
         else:
             bg_last = None
             last_idx = None
-        for i_c in range(tl.cdiv(BT, BC) - 1, -1, -1):
-            if HEAD_FIRST:
-                p_q = tl.make_block_ptr(q + i_nh * T*K, (K, T), (1, K), (i_k * BK, i_t * BT + i_c * BC), (BK, BC), (0, 1))
-                p_k = tl.make_block_ptr(k + i_nh * T*K, (T, K), (K, 1), (i_t * BT + i_c * BC, i_k * BK), (BC, BK), (1, 0))
-                p_d = tl.make_block_ptr(d + i_nh * T*K, (K, T), (1, K), (i_k * BK, i_t * BT + i_c * BC), (BK, BC), (0, 1))
-                p_dv = tl.make_block_ptr(dv + i_nh * T*V, (T, V), (V, 1), (i_t * BT + i_c * BC, i_v * BV), (BC, BV), (1, 0))
-                p_do = tl.make_block_ptr(do + i_nh * T*V, (T, V), (V, 1), (i_t * BT + i_c * BC, i_v * BV), (BC, BV), (1, 0))
-                p_g = tl.make_block_ptr(g + i_nh * T, (T,), (1,), (i_t * BT + i_c * BC,), (BC,), (0,)) if USE_G else None
-                p_dv2 = tl.make_block_ptr(dv2 + i_nh * T*V, (T, V), (V, 1), (i_t * BT + i_c * BC, i_v * BV), (BC, BV), (1, 0))
-            else:
-                p_q = tl.make_block_ptr(q+(bos*H+i_h)*K, (K, T), (1, H*K), (i_k * BK, i_t * BT + i_c * BC), (BK, BC), (0, 1))
-                p_k = tl.make_block_ptr(k+(bos*H+i_h)*K, (T, K), (H*K, 1), (i_t * BT + i_c * BC, i_k * BK), (BC, BK), (1, 0))
-                p_d = tl.make_block_ptr(d+(bos*H+i_h)*K, (K, T), (1, H*K), (i_k * BK, i_t * BT + i_c * BC), (BK, BC), (0, 1))
-                p_dv = tl.make_block_ptr(dv+(bos*H+i_h)*V, (T, V), (H*V, 1), (i_t*BT + i_c * BC, i_v * BV), (BC, BV), (1, 0))
-                p_do = tl.make_block_ptr(do+(bos*H+i_h)*V, (T, V), (H*V, 1), (i_t*BT + i_c * BC, i_v * BV), (BC, BV), (1, 0))
-                p_g = tl.make_block_ptr(g+bos*H+i_h, (T,), (H,), (i_t*BT + i_c * BC,), (BC,), (0,)) if USE_G else None
-                p_dv2 = tl.make_block_ptr(dv2+(bos*H+i_h)*V, (T, V), (H*V, 1), (i_t*BT + i_c * BC, i_v * BV), (BC, BV), (1, 0))
+        if BC == BT:
+            # the chunk is processed as a whole, so no q^T do of later sub-chunks needs to be carried
             b_g = tl.load(p_g, boundary_check=(0,)) if USE_G else None
             # [BK, BT]
             b_q = tl.load(p_q, boundary_check=(0, 1))
-            b_q = (b_q * scale * tl.exp(b_g)[None, :]).to(b_q.dtype) if USE_G else (b_q * scale).to(b_q.dtype)
             # [BT, BK]
             b_k = tl.load(p_k, boundary_check=(0, 1))
             b_d = tl.load(p_d, boundary_check=(0, 1))
+            # [BT, BV]
+            b_do = tl.load(p_do, boundary_check=(0, 1))
+
+            # [BT, BT]
+            b_A = tl.dot(b_k, b_q)
+            if USE_G:
+                b_A = b_A * safe_exp(b_g[None, :] - b_g[:, None])
+            b_A = tl.where(m_A, b_A * scale, 0).to(b_do.dtype)
+            b_dv = tl.dot(b_A, b_do)
+
+            b_q = (b_q * scale * tl.exp(b_g)[None, :]).to(b_q.dtype) if USE_G else (b_q * scale).to(b_q.dtype)
             b_k = (b_k * tl.exp(bg_last - b_g)[:, None]).to(b_k.dtype) if USE_G else b_k
             b_d = (b_d * tl.exp(b_g)[None, :]).to(b_d.dtype) if USE_G else b_d
-            # [BT, V]
-            b_do = tl.load(p_do, boundary_check=(0, 1))
-            b_dv = tl.load(p_dv, boundary_check=(0, 1))
-            b_dv2 = b_dv + tl.dot(b_k, b_dh.to(b_k.dtype), allow_tf32=False)
-            tl.store(p_dv2, b_dv2.to(p_dv.dtype.element_ty), boundary_check=(0, 1))
+            b_dv = tl.dot(b_k, b_dh.to(b_k.dtype), acc=b_dv)
+            tl.store(p_dv, b_dv.to(p_dv.dtype.element_ty), boundary_check=(0, 1))
             # [BK, BV]
-            b_dh_tmp += tl.dot(b_q, b_do.to(b_q.dtype), allow_tf32=False)
-            b_dh_tmp -= tl.dot(b_d, b_dv2.to(b_q.dtype), allow_tf32=False)
-        b_dh *= tl.exp(bg_last) if USE_G else 1
-        b_dh += b_dh_tmp
+            # dv has been computed from the previous dh, so the state gradient can be updated in place
+            if USE_G:
+                b_dh *= tl.exp(bg_last)
+            b_dh = tl.dot(b_q, b_do.to(b_q.dtype), acc=b_dh, allow_tf32=False)
+            b_dh = tl.dot(b_d, -b_dv.to(b_q.dtype), acc=b_dh, allow_tf32=False)
+            p_q = tl.advance(p_q, (0, -BT))
+            p_k = tl.advance(p_k, (-BT, 0))
+            p_d = tl.advance(p_d, (0, -BT))
+            p_do = tl.advance(p_do, (-BT, 0))
+            p_dv = tl.advance(p_dv, (-BT, 0))
+            if USE_G:
+                p_g = tl.advance(p_g, (-BT,))
+        else:
+            b_dh_tmp = tl.zeros([BK, BV], dtype=tl.float32)
+            # [BK, BV] the (scaled & decayed) q^T do of the sub-chunks after the current one within the chunk,
+            # which contributes to the intra-chunk dv of the current sub-chunk
+            b_qdo = tl.zeros([BK, BV], dtype=tl.float32)
+            for i_c in range(tl.cdiv(BT, BC) - 1, -1, -1):
+                p_q = tl.make_block_ptr(q, (K, T), (1, s_k), (i_k * BK, i_t * BT + i_c * BC), (BK, BC), (0, 1))
+                p_k = tl.make_block_ptr(k, (T, K), (s_k, 1), (i_t * BT + i_c * BC, i_k * BK), (BC, BK), (1, 0))
+                p_d = tl.make_block_ptr(d, (K, T), (1, s_k), (i_k * BK, i_t * BT + i_c * BC), (BK, BC), (0, 1))
+                p_do = tl.make_block_ptr(do, (T, V), (s_v, 1), (i_t * BT + i_c * BC, i_v * BV), (BC, BV), (1, 0))
+                p_dv = tl.make_block_ptr(dv, (T, V), (s_v, 1), (i_t * BT + i_c * BC, i_v * BV), (BC, BV), (1, 0))
+                p_g = tl.make_block_ptr(g, (T,), (s_g,), (i_t * BT + i_c * BC,), (BC,), (0,)) if USE_G else None
+                b_g = tl.load(p_g, boundary_check=(0,)) if USE_G else None
+                # [BK, BC]
+                b_q = tl.load(p_q, boundary_check=(0, 1))
+                # [BC, BK]
+                b_k = tl.load(p_k, boundary_check=(0, 1))
+                b_d = tl.load(p_d, boundary_check=(0, 1))
+                # [BC, BV]
+                b_do = tl.load(p_do, boundary_check=(0, 1))
+
+                # the intra-chunk part of dv, computed from the tiles already loaded for the state update
+                # [BC, BC]
+                b_A = tl.dot(b_k, b_q)
+                if USE_G:
+                    # decay w.r.t. the last position of the current sub-chunk, which keeps all exponents non-positive
+                    b_gc = tl.load(g + (min(i_t * BT + i_c * BC + BC, T) - 1) * s_g)
+                    b_A = tl.where(m_A, b_A * safe_exp(b_g[None, :] - b_g[:, None]) * scale, 0).to(b_do.dtype)
+                    b_dv = tl.dot(b_A, b_do)
+                    b_dv = tl.dot((b_k * safe_exp(b_gc - b_g)[:, None]).to(b_k.dtype), b_qdo.to(b_k.dtype), acc=b_dv)
+                else:
+                    b_A = tl.where(m_A, b_A * scale, 0).to(b_do.dtype)
+                    b_dv = tl.dot(b_A, b_do)
+                    b_dv = tl.dot(b_k, b_qdo.to(b_k.dtype), acc=b_dv)
+                if USE_G:
+                    if i_c > 0:
+                        # rebase onto the last position of the previous sub-chunk
+                        b_gp = tl.load(g + (min(i_t * BT + i_c * BC, T) - 1) * s_g)
+                        b_qdo *= tl.exp(b_gc - b_gp)
+                        b_qdo = tl.dot((b_q * scale * safe_exp(b_g - b_gp)[None, :]).to(b_q.dtype), b_do, acc=b_qdo)
+
+                b_q = (b_q * scale * tl.exp(b_g)[None, :]).to(b_q.dtype) if USE_G else (b_q * scale).to(b_q.dtype)
+                b_k = (b_k * tl.exp(bg_last - b_g)[:, None]).to(b_k.dtype) if USE_G else b_k
+                b_d = (b_d * tl.exp(b_g)[None, :]).to(b_d.dtype) if USE_G else b_d
+                b_dv = tl.dot(b_k, b_dh.to(b_k.dtype), acc=b_dv)
+                tl.store(p_dv, b_dv.to(p_dv.dtype.element_ty), boundary_check=(0, 1))
+                # [BK, BV]
+                b_qdo_c = tl.dot(b_q, b_do.to(b_q.dtype), allow_tf32=False)
+                if not USE_G:
+                    b_qdo += b_qdo_c
+                b_dh_tmp += b_qdo_c
+                b_dh_tmp -= tl.dot(b_d, b_dv.to(b_q.dtype), allow_tf32=False)
+            b_dh *= tl.exp(bg_last) if USE_G else 1
+            b_dh += b_dh_tmp
 
     if USE_INITIAL_STATE:
         p_dh0 = tl.make_block_ptr(dh0 + i_nh * K*V, (K, V), (V, 1), (i_k * BK, i_v * BV), (BK, BV), (1, 0))
@@ -260,22 +393,9 @@ def chunk_gated_delta_rule_fwd_h(
         N = len(offsets) - 1
         chunk_offsets = prepare_chunk_offsets(offsets, BT)
         NT = chunk_offsets[-1]
-    BK = triton.next_power_of_2(K)
+    BK, BC = get_block_sizes(K, BT, k.device.index)
     assert BK <= 256, "current kernel does not support head dimension larger than 256."
-    # H100 can have larger block size
-    if torch.cuda.get_device_capability()[0] >= 9:
-        BV = 64
-        BC = 64
-    # A100
-    elif torch.cuda.get_device_capability() == (8, 0):
-        BV = 32
-        BC = 64
-    else:
-        BV = 32
-        BC = 64 if K <= 128 else 32
-    BC = min(BT, BC)
     NK = triton.cdiv(K, BK)
-    NV = triton.cdiv(V, BV)
     assert NK == 1, 'NK > 1 is not supported because it involves time-consuming synchronization'
 
     if head_first:
@@ -285,7 +405,7 @@ def chunk_gated_delta_rule_fwd_h(
     final_state = k.new_empty(N, H, K, V, dtype=torch.float32) if output_final_state else None
 
     v_new = torch.empty_like(u)
-    grid = (NK, NV, N * H)
+    def grid(meta): return (NK, triton.cdiv(V, meta['BV']), N * H)
 
     chunk_gated_delta_rule_fwd_kernel_h[grid](
         k=k,
@@ -298,6 +418,7 @@ def chunk_gated_delta_rule_fwd_h(
         ht=final_state,
         offsets=offsets,
         chunk_offsets=chunk_offsets,
+        NG=triton.next_power_of_2(N * H),
         T=T,
         H=H,
         K=K,
@@ -305,7 +426,6 @@ def chunk_gated_delta_rule_fwd_h(
         BT=BT,
         BC=BC,
         BK=BK,
-        BV=BV,
         NT=NT,
         HEAD_FIRST=head_first
     )
@@ -320,7 +440,6 @@ def chunk_gated_delta_rule_bwd_dhu(
     h0: torch.Tensor,
     dht: Optional[torch.Tensor],
     do: torch.Tensor,
-    dv: torch.Tensor,
     scale: float,
     offsets: Optional[torch.LongTensor] = None,
     head_first: bool = True,
@@ -339,21 +458,9 @@ def chunk_gated_delta_rule_bwd_dhu(
         chunk_offsets = prepare_chunk_offsets(offsets, BT)
         NT = chunk_offsets[-1]
 
-    BK = triton.next_power_of_2(K)
+    BK, BC = get_block_sizes(K, BT, q.device.index, backward=True)
     assert BK <= 256, "current kernel does not support head dimension being larger than 256."
-    # H100
-    if torch.cuda.get_device_capability()[0] >= 9:
-        BV = 64
-        BC = 64
-    # A100
-    elif torch.cuda.get_device_capability() == (8, 0):
-        BV = 32
-        BC = 64 if K <= 128 else 32
-    else:
-        BV = 32
-        BC = 64 if K <= 128 else 32
-    BC = min(BT, BC)
-    NK, NV = triton.cdiv(K, BK), triton.cdiv(V, BV)
+    NK = triton.cdiv(K, BK)
     assert NK == 1, 'NK > 1 is not supported because it involves time-consuming synchronization'
 
     if head_first:
@@ -361,9 +468,9 @@ def chunk_gated_delta_rule_bwd_dhu(
     else:
         dh = q.new_empty(B, NT, H, K, V)
     dh0 = torch.empty_like(h0, dtype=torch.float32) if h0 is not None else None
-    dv2 = torch.empty_like(dv)
+    dv = torch.empty_like(do)
 
-    grid = (NK, NV, N * H)
+    def grid(meta): return (NK, triton.cdiv(V, meta['BV']), N * H)
     chunk_gated_delta_rule_bwd_kernel_dhu[grid](
         q=q,
         k=k,
@@ -374,10 +481,10 @@ def chunk_gated_delta_rule_bwd_dhu(
         do=do,
         dh=dh,
         dv=dv,
-        dv2=dv2,
         offsets=offsets,
         chunk_offsets=chunk_offsets,
         scale=scale,
+        NG=triton.next_power_of_2(N * H),
         T=T,
         H=H,
         K=K,
@@ -385,7 +492,6 @@ def chunk_gated_delta_rule_bwd_dhu(
         BT=BT,
         BC=BC,
         BK=BK,
-        BV=BV,
         HEAD_FIRST=head_first
     )
-    return dh, dh0, dv2
+    return dh, dh0, dv
@@ -40,6 +40,7 @@ def chunk_fwd_kernel_o(
     K: tl.constexpr,
     V: tl.constexpr,
     BT: tl.constexpr,
+    BC: tl.constexpr,
     BK: tl.constexpr,
     BV: tl.constexpr,
     USE_G: tl.constexpr,
@@ -70,44 +71,75 @@ def chunk_fwd_kernel_o(
     o += (i_bh * T*V) if HEAD_FIRST else ((bos * H + i_h) * V)
     h += ((i_bh * NT + i_t).to(tl.int64) * K*V) if HEAD_FIRST else ((i_tg * H + i_h).to(tl.int64) * K*V)
 
-    b_o = tl.zeros([BT, BV], dtype=tl.float32)
-    b_A = tl.zeros([BT, BT], dtype=tl.float32)
-
-    for i_k in range(tl.cdiv(K, BK)):
-        p_q = tl.make_block_ptr(q, (T, K), (s_qk, 1), (i_t * BT, i_k * BK), (BT, BK), (1, 0))
-        p_k = tl.make_block_ptr(k, (K, T), (1, s_qk), (i_k * BK, i_t * BT), (BK, BT), (0, 1))
+    # the chunk is split into two halves of size BC, so that the [BT, BT] scores consist of
+    # the causally masked diagonal blocks A_11/A_22 and the unmasked sub-diagonal block A_21,
+    # while the all-zero upper block A_12 is never computed
+    b_o1 = tl.zeros([BC, BV], dtype=tl.float32)
+    b_A11 = tl.zeros([BC, BC], dtype=tl.float32)
+    if BC < BT:
+        b_o2 = tl.zeros([BC, BV], dtype=tl.float32)
+        b_A21 = tl.zeros([BC, BC], dtype=tl.float32)
+        b_A22 = tl.zeros([BC, BC], dtype=tl.float32)
+
+    for i_k in tl.static_range((K + BK - 1) // BK):
+        p_q1 = tl.make_block_ptr(q, (T, K), (s_qk, 1), (i_t * BT, i_k * BK), (BC, BK), (1, 0))
+        p_k1 = tl.make_block_ptr(k, (K, T), (1, s_qk), (i_k * BK, i_t * BT), (BK, BC), (0, 1))
         p_h = tl.make_block_ptr(h, (K, V), (V, 1), (i_k * BK, i_v * BV), (BK, BV), (1, 0))
-        # [BT, BK]
-        b_q = tl.load(p_q, boundary_check=(0, 1))
-        # [BK, BT]
-        b_k = tl.load(p_k, boundary_check=(0, 1))
-        # [BK, BV]
-        b_h = tl.load(p_h, boundary_check=(0, 1))
-
-        # [BT, BK] @ [BK, BV] -> [BT, BV]
-        b_o += tl.dot(b_q, b_h)
-        # [BT, BK] @ [BK, BT] -> [BT, BT]
-        b_A += tl.dot(b_q, b_k)
+        # [BC, BK]
+        b_q1 = tl.load(p_q1, boundary_check=(0, 1))
+        # [BK, BC]
+        b_k1 = tl.load(p_k1, boundary_check=(0, 1))
+        # [BK, BV], the states may be kept in fp32
+        b_h = tl.load(p_h, boundary_check=(0, 1)).to(b_q1.dtype)
+
+        # [BC, BK] @ [BK, BV] -> [BC, BV]
+        b_o1 = tl.dot(b_q1, b_h, acc=b_o1)
+        # [BC, BK] @ [BK, BC] -> [BC, BC]
+        b_A11 = tl.dot(b_q1, b_k1, acc=b_A11)
+        if BC < BT:
+            p_q2 = tl.make_block_ptr(q, (T, K), (s_qk, 1), (i_t * BT + BC, i_k * BK), (BC, BK), (1, 0))
+            p_k2 = tl.make_block_ptr(k, (K, T), (1, s_qk), (i_k * BK, i_t * BT + BC), (BK, BC), (0, 1))
+            b_q2 = tl.load(p_q2, boundary_check=(0, 1))
+            b_k2 = tl.load(p_k2, boundary_check=(0, 1))
+            b_o2 = tl.dot(b_q2, b_h, acc=b_o2)
+            b_A21 = tl.dot(b_q2, b_k1, acc=b_A21)
+            b_A22 = tl.dot(b_q2, b_k2, acc=b_A22)
 
     if USE_G:
         g += (i_bh * T) if HEAD_FIRST else (bos * H + i_h)
-        p_g = tl.make_block_ptr(g, (T,), (s_g,), (i_t * BT,), (BT,), (0,))
-        b_g = tl.load(p_g, boundary_check=(0,))
-        b_o = b_o * tl.exp(b_g)[:, None]
-        b_A = b_A * safe_exp(b_g[:, None] - b_g[None, :])
-
-    o_i = tl.arange(0, BT)
+        p_g1 = tl.make_block_ptr(g, (T,), (s_g,), (i_t * BT,), (BC,), (0,))
+        b_g1 = tl.load(p_g1, boundary_check=(0,))
+        b_o1 = b_o1 * tl.exp(b_g1)[:, None]
+        b_A11 = b_A11 * safe_exp(b_g1[:, None] - b_g1[None, :])
+        if BC < BT:
+            p_g2 = tl.make_block_ptr(g, (T,), (s_g,), (i_t * BT + BC,), (BC,), (0,))
+            b_g2 = tl.load(p_g2, boundary_check=(0,))
+            b_o2 = b_o2 * tl.exp(b_g2)[:, None]
+            b_A21 = b_A21 * safe_exp(b_g2[:, None] - b_g1[None, :])
+            b_A22 = b_A22 * safe_exp(b_g2[:, None] - b_g2[None, :])
+
+    o_i = tl.arange(0, BC)
     m_A = o_i[:, None] >= o_i[None, :]
-    b_A = tl.where(m_A, b_A, 0)
-
-    p_v = tl.make_block_ptr(v, (T, V), (s_vo, 1), (i_t * BT, i_v * BV), (BT, BV), (1, 0))
-    p_o = tl.make_block_ptr(o, (T, V), (s_vo, 1), (i_t * BT, i_v * BV), (BT, BV), (1, 0))
-    b_v = tl.load(p_v, boundary_check=(0, 1))
-
+    # the scores are only used as dot operands from here on,
+    # so they are kept in the input precision rather than as fp32 tiles
+    b_A11 = tl.where(m_A, b_A11, 0).to(v.dtype.element_ty)
+    if BC < BT:
+        b_A21 = b_A21.to(v.dtype.element_ty)
+        b_A22 = tl.where(m_A, b_A22, 0).to(v.dtype.element_ty)
+
+    p_v1 = tl.make_block_ptr(v, (T, V), (s_vo, 1), (i_t * BT, i_v * BV), (BC, BV), (1, 0))
+    p_o1 = tl.make_block_ptr(o, (T, V), (s_vo, 1), (i_t * BT, i_v * BV), (BC, BV), (1, 0))
+    b_v1 = tl.load(p_v1, boundary_check=(0, 1))
     # to fix mma -> mma layout conversion
     # already solved by triton v3.2 or higher
-    b_o = b_o * scale + tl.dot(b_A.to(b_v.dtype), b_v) * scale
-    tl.store(p_o, b_o.to(p_o.dtype.element_ty), boundary_check=(0, 1))
+    b_o1 = (b_o1 + tl.dot(b_A11, b_v1)) * scale
+    tl.store(p_o1, b_o1.to(p_o1.dtype.element_ty), boundary_check=(0, 1))
+    if BC < BT:
+        p_v2 = tl.make_block_ptr(v, (T, V), (s_vo, 1), (i_t * BT + BC, i_v * BV), (BC, BV), (1, 0))
+        p_o2 = tl.make_block_ptr(o, (T, V), (s_vo, 1), (i_t * BT + BC, i_v * BV), (BC, BV), (1, 0))
+        b_v2 = tl.load(p_v2, boundary_check=(0, 1))
+        b_o2 = (b_o2 + tl.dot(b_A21, b_v1) + tl.dot(b_A22, b_v2)) * scale
+        tl.store(p_o2, b_o2.to(p_o2.dtype.element_ty), boundary_check=(0, 1))
 
 
 @triton.heuristics({
@@ -119,7 +151,7 @@ def chunk_fwd_kernel_o(
     configs=[
         triton.Config({}, num_warps=num_warps, num_stages=num_stages)
         for num_warps in [2, 4, 8]
-        for num_stages in [2, 3]
+        for num_stages in [2, 3, 4]
     ],
     key=["BT", "BK", "BV", "USE_G", "USE_DW"],
 )
@@ -194,29 +226,35 @@ def chunk_bwd_kernel_dqkwg(
     b_dg_last = tl.zeros([1,], dtype=tl.float32) if USE_G else None
     b_dw = tl.zeros([BT, BK], dtype=tl.float32) if USE_DW else None
 
-    for i_v in range(tl.cdiv(V, BV)):
-        p_v = tl.make_block_ptr(v, (T, V), (s_vo, 1), (i_t * BT, i_v * BV), (BT, BV), (1, 0))
-        p_do = tl.make_block_ptr(do, (T, V), (s_vo, 1), (i_t * BT, i_v * BV), (BT, BV), (1, 0))
-        p_h = tl.make_block_ptr(h, (V, K), (1, V), (i_v * BV, i_k * BK), (BV, BK), (0, 1))
-        p_dh = tl.make_block_ptr(dh, (V, K), (1, V), (i_v * BV, i_k * BK), (BV, BK), (0, 1))
+    p_v = tl.make_block_ptr(v, (T, V), (s_vo, 1), (i_t * BT, 0), (BT, BV), (1, 0))
+    p_do = tl.make_block_ptr(do, (T, V), (s_vo, 1), (i_t * BT, 0), (BT, BV), (1, 0))
+    p_h = tl.make_block_ptr(h, (K, V), (V, 1), (i_k * BK, 0), (BK, BV), (1, 0))
+    p_dh = tl.make_block_ptr(dh, (K, V), (V, 1), (i_k * BK, 0), (BK, BV), (1, 0))
+    p_dv = tl.make_block_ptr(dv, (T, V), (s_vo, 1), (i_t * BT, 0), (BT, BV), (1, 0)) if USE_DW else None
+    for _ in range(tl.cdiv(V, BV)):
+        # issue all loads of the current V tile before any of the dots
         # [BT, BV]
         b_v = tl.load(p_v, boundary_check=(0, 1))
         b_do = tl.load(p_do, boundary_check=(0, 1))
-        # [BV, BK]
+        b_dv = tl.load(p_dv, boundary_check=(0, 1)) if USE_DW else None
+        # [BK, BV]
         b_h = tl.load(p_h, boundary_check=(0, 1))
         b_dh = tl.load(p_dh, boundary_check=(0, 1))
         if USE_G:
             b_dg_last += (tl.sum(b_h * b_dh))
         # [BT, BV] @ [BV, BT] -> [BT, BT]
-        b_ds += tl.dot(b_do, tl.trans(b_v))
+        b_ds = tl.dot(b_do, tl.trans(b_v), acc=b_ds)
         # [BT, BV] @ [BV, BK] -> [BT, BK]
-        b_dq += tl.dot(b_do, b_h.to(b_do.dtype))
+        b_dq = tl.dot(b_do, tl.trans(b_h).to(b_do.dtype), acc=b_dq)
         # [BT, BV] @ [BV, BK] -> [BT, BK]
-        b_dk += tl.dot(b_v, b_dh.to(b_v.dtype))
+        b_dk = tl.dot(b_v, tl.trans(b_dh).to(b_v.dtype), acc=b_dk)
         if USE_DW:
-            p_dv = tl.make_block_ptr(dv, (T, V), (s_vo, 1), (i_t * BT, i_v * BV), (BT, BV), (1, 0))
-            b_dv = tl.load(p_dv, boundary_check=(0, 1))
-            b_dw += tl.dot(b_dv.to(b_v.dtype), b_h.to(b_v.dtype))
+            b_dw = tl.dot(b_dv.to(b_v.dtype), tl.trans(b_h).to(b_v.dtype), acc=b_dw)
+            p_dv = tl.advance(p_dv, (0, BV))
+        p_v = tl.advance(p_v, (0, BV))
+        p_do = tl.advance(p_do, (0, BV))
+        p_h = tl.advance(p_h, (0, BV))
+        p_dh = tl.advance(p_dh, (0, BV))
 
     if USE_DW and not USE_G:
         p_dw = tl.make_block_ptr(dw, (T, K), (s_qk, 1), (i_t * BT, i_k * BK), (BT, BK), (1, 0))
@@ -263,8 +301,8 @@ def chunk_bwd_kernel_dqkwg(
 
         b_ds = b_ds.to(b_k.dtype)
         # [BT, BK]
-        b_dq += tl.dot(b_ds, b_k)
-        b_dk += tl.dot(tl.trans(b_ds), b_q)
+        b_dq = tl.dot(b_ds, b_k, acc=b_dq)
+        b_dk = tl.dot(tl.trans(b_ds), b_q, acc=b_dk)
         p_dg = tl.make_block_ptr(dg, (T,), (s_g,), (i_t * BT,), (BT,), (0,))
         # (SY 09/21) revcumsum in a separate kernel due to strange triton compiler issue
         # b_dg = tl.dot(tl.where(o_i[:, None] <= o_i[None, :], 1., 0.), b_dg, allow_tf32=False) + b_dg_last)
@@ -273,11 +311,11 @@ def chunk_bwd_kernel_dqkwg(
         tl.store(p_dk, b_dk.to(p_dk.dtype.element_ty), boundary_check=(0, 1))
         tl.store(p_dg, b_dg.to(p_dg.dtype.element_ty), boundary_check=(0,))
     else:
-        b_ds = tl.where(o_i[:, None] >= o_i[None, :], b_ds, 0)
+        # apply the scale once on the [BT, BT] scores rather than on both dq and dk
+        b_ds = tl.where(o_i[:, None] >= o_i[None, :], b_ds * scale, 0)
         b_ds = b_ds.to(b_k.dtype)
-        b_dq += tl.dot(b_ds, b_k)
-        b_dk += tl.dot(tl.trans(b_ds), b_q) * scale
-        b_dq *= scale
+        b_dq = tl.dot(b_ds, b_k, acc=b_dq * scale)
+        b_dk = tl.dot(tl.trans(b_ds), b_q, acc=b_dk)
         tl.store(p_dq, b_dq.to(p_dq.dtype.element_ty), boundary_check=(0, 1))
         tl.store(p_dk, b_dk.to(p_dk.dtype.element_ty), boundary_check=(0, 1))
 
@@ -341,7 +379,7 @@ def chunk_bwd_kernel_dv(
     dh += (i_bh * NT + i_t).to(tl.int64) * K*V if HEAD_FIRST else (i_tg * H + i_h).to(tl.int64) * K*V
 
     b_A = tl.zeros([BT, BT], dtype=tl.float32)
-    for i_k in range(tl.cdiv(K, BK)):
+    for i_k in tl.static_range((K + BK - 1) // BK):
         p_k = tl.make_block_ptr(k, (T, K), (s_qk, 1), (i_t * BT, i_k * BK), (BT, BK), (1, 0))
         p_q = tl.make_block_ptr(q, (K, T), (1, s_qk), (i_k * BK, i_t * BT), (BK, BT), (0, 1))
         b_q = tl.load(p_q, boundary_check=(0, 1))
@@ -372,83 +410,6 @@ def chunk_bwd_kernel_dv(
     tl.store(p_dv, b_dv.to(p_dv.dtype.element_ty), boundary_check=(0, 1))
 
 
-@triton.heuristics({
-    'USE_OFFSETS': lambda args: args['offsets'] is not None,
-    'USE_G': lambda args: args['g'] is not None,
-})
-@triton.autotune(
-    configs=[
-        triton.Config({}, num_warps=num_warps)
-        for num_warps in [4]
-    ],
-    key=["BT", "BK", "BV", "USE_G"],
-)
-@triton.jit
-def chunk_bwd_kernel_dv_local(
-    q,
-    k,
-    g,
-    do,
-    dv,
-    offsets,
-    indices,
-    scale,
-    T: tl.constexpr,
-    H: tl.constexpr,
-    K: tl.constexpr,
-    V: tl.constexpr,
-    BT: tl.constexpr,
-    BK: tl.constexpr,
-    BV: tl.constexpr,
-    USE_OFFSETS: tl.constexpr,
-    HEAD_FIRST: tl.constexpr,
-    USE_G: tl.constexpr,
-):
-    i_t, i_bh = tl.program_id(0), tl.program_id(1)
-    i_b, i_h = i_bh // H, i_bh % H
-    if USE_OFFSETS:
-        i_n, i_t = tl.load(indices + i_t * 2).to(tl.int32), tl.load(indices + i_t * 2 + 1).to(tl.int32)
-        bos, eos = tl.load(offsets + i_n).to(tl.int32), tl.load(offsets + i_n + 1).to(tl.int32)
-        T = eos - bos
-    else:
-        bos, eos = i_b * T, i_b * T + T
-
-    # offset calculation
-    q += i_bh * T*K if HEAD_FIRST else (bos * H + i_h) * K
-    k += i_bh * T*K if HEAD_FIRST else (bos * H + i_h) * K
-    do += i_bh * T*V if HEAD_FIRST else (bos * H + i_h) * V
-    dv += i_bh * T*V if HEAD_FIRST else (bos * H + i_h) * V
-    s_qk = K if HEAD_FIRST else H*K
-    s_vo = V if HEAD_FIRST else H*V
-    s_g = 1 if HEAD_FIRST else H
-
-    b_A = tl.zeros([BT, BT], dtype=tl.float32)
-    for i_k in range(tl.cdiv(K, BK)):
-        p_k = tl.make_block_ptr(k, (T, K), (s_qk, 1), (i_t * BT, i_k * BK), (BT, BK), (1, 0))
-        p_q = tl.make_block_ptr(q, (K, T), (1, s_qk), (i_k * BK, i_t * BT), (BK, BT), (0, 1))
-        b_q = tl.load(p_q, boundary_check=(0, 1))
-        b_k = tl.load(p_k, boundary_check=(0, 1))
-        b_A += tl.dot(b_k, b_q)
-
-    if USE_G:
-        g += (i_bh * T) if HEAD_FIRST else (bos * H + i_h)
-        p_g = tl.make_block_ptr(g, (T,), (s_g,), (i_t * BT,), (BT,), (0,))
-        b_g = tl.load(p_g, boundary_check=(0,))
-
-    mask = (tl.arange(0, BT)[:, None] <= tl.arange(0, BT)[None, :])
-    if USE_G:
-        b_A = tl.where(mask, b_A * safe_exp(b_g[None, :] - b_g[:, None]) * scale, 0).to(do.dtype.element_ty)
-    else:
-        b_A = tl.where(mask, b_A * scale, 0).to(do.dtype.element_ty)
-
-    for i_v in range(tl.cdiv(V, BV)):
-        p_do = tl.make_block_ptr(do, (T, V), (s_vo, 1), (i_t * BT, i_v * BV), (BT, BV), (1, 0))
-        p_dv = tl.make_block_ptr(dv, (T, V), (s_vo, 1), (i_t * BT, i_v * BV), (BT, BV), (1, 0))
-        b_do = tl.load(p_do, boundary_check=(0, 1))
-        b_dv = tl.dot(b_A.to(b_do.dtype), b_do)
-        tl.store(p_dv, b_dv.to(p_dv.dtype.element_ty), boundary_check=(0, 1))
-
-
 def chunk_fwd_o(
     q: torch.Tensor,
     k: torch.Tensor,
@@ -468,6 +429,8 @@ def chunk_fwd_o(
     if scale is None:
         scale = k.shape[-1] ** -0.5
     BT = min(chunk_size, max(16, triton.next_power_of_2(T)))
+    # halves smaller than 16 are not supported by tl.dot
+    BC = BT // 2 if BT >= 32 else BT
     NT = triton.cdiv(T, BT) if offsets is None else len(indices)
 
     o = torch.empty_like(v)
@@ -488,6 +451,7 @@ def chunk_fwd_o(
         K=K,
         V=V,
         BT=BT,
+        BC=BC,
         HEAD_FIRST=head_first
     )
     return o
@@ -539,50 +503,6 @@ def chunk_bwd_dv(
     return dv
 
 
-def chunk_bwd_dv_local(
-    q: torch.Tensor,
-    k: torch.Tensor,
-    g: torch.Tensor,
-    do: torch.Tensor,
-    dh: torch.Tensor,
-    scale: float,
-    offsets: Optional[torch.LongTensor] = None,
-    indices: Optional[torch.LongTensor] = None,
-    head_first: bool = True,
-    chunk_size: int = 64
-) -> torch.Tensor:
-    if head_first:
-        B, H, T, K, V = *k.shape, do.shape[-1]
-    else:
-        B, T, H, K, V = *k.shape, do.shape[-1]
-    BT = min(chunk_size, max(16, triton.next_power_of_2(T)))
-    BK = min(triton.next_power_of_2(K), 128)
-    BV = min(triton.next_power_of_2(V), 128)
-    NT = triton.cdiv(T, BT) if offsets is None else len(indices)
-
-    dv = torch.empty_like(do)
-    grid = (NT, B * H)
-    chunk_bwd_kernel_dv_local[grid](
-        q,
-        k,
-        g,
-        do,
-        dv,
-        offsets,
-        indices,
-        scale,
-        T=T,
-        H=H,
-        K=K,
-        V=V,
-        BT=BT,
-        BK=BK,
-        BV=BV,
-        HEAD_FIRST=head_first
-    )
-    return dv
-
-
 def chunk_bwd_dqkwg(
     q: torch.Tensor,
     k: torch.Tensor,
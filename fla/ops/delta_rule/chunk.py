@@ -9,8 +9,7 @@ import triton
 from fla.modules.l2norm import l2norm_bwd, l2norm_fwd
 from fla.ops.common.chunk_delta_h import (chunk_gated_delta_rule_bwd_dhu,
                                           chunk_gated_delta_rule_fwd_h)
-from fla.ops.common.chunk_o import (chunk_bwd_dqkwg, chunk_bwd_dv_local,
-                                    chunk_fwd_o)
+from fla.ops.common.chunk_o import chunk_bwd_dqkwg, chunk_fwd_o
 from fla.ops.common.utils import prepare_chunk_indices
 from fla.ops.delta_rule.wy_fast import (bwd_prepare_wy_repr,
                                         fwd_prepare_wy_repr, fwd_recompute_w_u)
@@ -107,18 +106,6 @@ def chunk_delta_rule_bwd(
         head_first=head_first,
         chunk_size=BT
     )
-    dv = chunk_bwd_dv_local(
-        q=q,
-        k=k,
-        do=do,
-        g=None,
-        dh=None,
-        scale=scale,
-        offsets=offsets,
-        indices=indices,
-        head_first=head_first,
-        chunk_size=BT
-    )
     dh, dh0, dv = chunk_gated_delta_rule_bwd_dhu(
         q=q,
         k=k,
@@ -127,7 +114,6 @@ def chunk_delta_rule_bwd(
         h0=initial_state,
         dht=dht,
         do=do,
-        dv=dv,
         scale=scale,
         offsets=offsets,
         head_first=head_first,
@@ -149,7 +135,8 @@ def chunk_delta_rule_bwd(
         head_first=head_first,
         chunk_size=BT
     )
-    dk2, dv, db = bwd_prepare_wy_repr(
+    # the dv from `chunk_gated_delta_rule_bwd_dhu` is passed as du and overwritten with the final dv
+    dk, dv, db = bwd_prepare_wy_repr(
         k=k,
         v=v,
         beta=beta,
@@ -159,9 +146,10 @@ def chunk_delta_rule_bwd(
         offsets=offsets,
         indices=indices,
         head_first=head_first,
-        chunk_size=BT
+        chunk_size=BT,
+        # the dk from `chunk_bwd_dqkwg` is accumulated into in place rather than added afterwards
+        dk=dk
     )
-    dk.add_(dk2)
     return dq, dk, dv, db, dh0
 
 
@@ -9,8 +9,7 @@ import triton
 from fla.modules.l2norm import l2norm_bwd, l2norm_fwd
 from fla.ops.common.chunk_delta_h import (chunk_gated_delta_rule_bwd_dhu,
                                           chunk_gated_delta_rule_fwd_h)
-from fla.ops.common.chunk_o import (chunk_bwd_dqkwg, chunk_bwd_dv_local,
-                                    chunk_fwd_o)
+from fla.ops.common.chunk_o import chunk_bwd_dqkwg, chunk_fwd_o
 from fla.ops.gated_delta_rule.wy_fast import (bwd_prepare_wy_repr,
                                               fwd_prepare_wy_repr,
                                               fwd_recompute_w_u)
@@ -115,18 +114,6 @@ def chunk_gated_delta_rule_bwd(
         head_first=head_first,
         chunk_size=BT
     )
-    dv = chunk_bwd_dv_local(
-        q=q,
-        k=k,
-        g=g,
-        do=do,
-        dh=None,
-        scale=scale,
-        offsets=offsets,
-        indices=indices,
-        head_first=head_first,
-        chunk_size=BT
-    )
     dh, dh0, dv = chunk_gated_delta_rule_bwd_dhu(
         q=q,
         k=k,
@@ -135,7 +122,6 @@ def chunk_gated_delta_rule_bwd(
         h0=initial_state,
         dht=dht,
         do=do,
-        dv=dv,
         scale=scale,
         offsets=offsets,
         head_first=head_first,
@@ -157,7 +143,8 @@ def chunk_gated_delta_rule_bwd(
         head_first=head_first,
         chunk_size=BT
     )
-    dk2, dv, db, dg2 = bwd_prepare_wy_repr(
+    # the dv from `chunk_gated_delta_rule_bwd_dhu` is passed as du and overwritten with the final dv
+    dk, dv, db, dg2 = bwd_prepare_wy_repr(
         k=k,
         v=v,
         beta=beta,
@@ -169,9 +156,10 @@ def chunk_gated_delta_rule_bwd(
         offsets=offsets,
         indices=indices,
         head_first=head_first,
-        chunk_size=BT
+        chunk_size=BT,
+        # the dk from `chunk_bwd_dqkwg` is accumulated into in place rather than added afterwards
+        dk=dk
     )
-    dk.add_(dk2)
     dg.add_(dg2)
     assert dg.dtype == torch.float32, "dg should be fp32"
     dg = chunk_local_cumsum(dg, chunk_size, reverse=True, offsets=offsets, head_first=head_first)
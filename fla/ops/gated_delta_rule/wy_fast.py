@@ -428,6 +428,8 @@ def fwd_recompute_w_u(
         for num_warps in [1, 2, 4]
     ],
     key=["BT", "BK", "BV"],
+    # dv is written in place of du, and dk is accumulated in place, both of which are read by the kernel
+    restore_value=["du", "dk"]
 )
 @triton.jit
 def bwd_prepare_wy_repr_kernel(
@@ -479,7 +481,7 @@ def bwd_prepare_wy_repr_kernel(
         b_dw = tl.load(p_dw, boundary_check=(0, 1))
         b_dA += tl.dot(b_dw, tl.trans(b_k_beta), allow_tf32=False)
         b_dk_beta = tl.dot(b_A, b_dw, allow_tf32=False)
-        b_dk = b_dk_beta * b_beta[:, None]
+        b_dk = tl.load(p_dk, boundary_check=(0, 1)) + b_dk_beta * b_beta[:, None]
         b_dbeta += tl.sum(b_dk_beta * b_k, 1)
         tl.store(p_dk, b_dk.to(p_dk.dtype.element_ty), boundary_check=(0, 1))
 
@@ -567,8 +569,13 @@ def bwd_prepare_wy_repr(
     offsets: Optional[torch.LongTensor],
     indices: Optional[torch.LongTensor],
     head_first: bool,
-    chunk_size: int
+    chunk_size: int,
+    dk: Optional[torch.Tensor] = None
 ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+    """
+    Note that both `du` and `dk` are modified in place:
+    `du` is overwritten with the returned dv, and the gradients w.r.t. k are accumulated into `dk` if given.
+    """
     if head_first:
         B, H, T, K, V = *k.shape, v.shape[-1]
     else:
@@ -584,8 +591,10 @@ def bwd_prepare_wy_repr(
     BK = min(triton.next_power_of_2(K), 64)
     BV = min(triton.next_power_of_2(V), 64)
 
-    dk = torch.empty_like(k)
-    dv = torch.empty_like(v)
+    # the gradients w.r.t. k are accumulated into dk if given, e.g., the one from `chunk_bwd_dqkwg`
+    dk = torch.zeros_like(k) if dk is None else dk
+    # du is not needed after the kernel, so dv overwrites it tile by tile
+    dv = du
     dbeta = torch.empty_like(beta)
     dg = torch.empty_like(g)
     bwd_prepare_wy_repr_kernel[(NT, B * H)](
@@ -16,7 +16,8 @@ def chunk_retention(
     initial_state: Optional[torch.Tensor] = None,
     output_final_state: bool = False,
     cu_seqlens: Optional[torch.LongTensor] = None,
-    head_first: bool = True
+    head_first: bool = True,
+    checkpoint_level: int = 1
 ) -> Tuple[torch.Tensor, torch.Tensor]:
     r"""
     Args:
@@ -41,6 +42,11 @@ def chunk_retention(
         head_first (Optional[bool]):
             Whether the inputs are in the head-first format, which is not supported for variable-length inputs.
             Default: `True`.
+        checkpoint_level (Optional[int]):
+            Checkpointing level; higher values will save more memories and do more recomputations during backward.
+            Default: `1`:
+            - Level `0`: save the fp32 chunk-level hidden states for backward, no recomputation.
+            - Level `1`: recompute the chunk-level hidden states during backward.
 
     Returns:
         o (torch.Tensor):
@@ -67,5 +73,6 @@ def chunk_retention(
         initial_state=initial_state,
         output_final_state=output_final_state,
         head_first=head_first,
-        cu_seqlens=cu_seqlens
+        cu_seqlens=cu_seqlens,
+        checkpoint_level=checkpoint_level
     )
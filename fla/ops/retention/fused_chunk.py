@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 # Copyright (c) 2023-2025, Songlin Yang, Yu Zhang
 
+import functools
 from typing import Optional, Tuple
 
 import torch
@@ -11,6 +12,28 @@ from packaging import version
 from fla.utils import autocast_custom_bwd, autocast_custom_fwd, contiguous
 
 
+@functools.lru_cache(maxsize=None)
+def prepare_log_decay(H: int, device: torch.device) -> torch.Tensor:
+    # log2 of the decay rates `1 - 2^(-5-h)` of all heads, shared by all programs and calls
+    return torch.log2(1 - torch.exp2(-5 - torch.arange(H, dtype=torch.float, device=device)))
+
+
+@functools.lru_cache(maxsize=None)
+def prepare_chunk_decay(H: int, BT: int, device: torch.device) -> torch.Tensor:
+    # [H, BT, BT] causal intra-chunk decays `gamma^(i-j)` of all heads
+    o_i = torch.arange(BT, dtype=torch.float, device=device)
+    d_s = torch.exp2((o_i[:, None] - o_i[None, :]) * prepare_log_decay(H, device)[:, None, None])
+    return d_s.masked_fill_(o_i[:, None] < o_i[None, :], 0)
+
+
+@triton.autotune(
+    configs=[
+        triton.Config({}, num_warps=num_warps, num_stages=num_stages)
+        for num_warps in [2, 4, 8]
+        for num_stages in [1, 2, 3, 4]
+    ],
+    key=["BK", "BV"],
+)
 @triton.jit
 def fused_chunk_retention_fwd_kernel(
     q,
@@ -19,6 +42,8 @@ def fused_chunk_retention_fwd_kernel(
     o,
     h0,
     ht,
+    d,
+    ds,
     scale,
     B: tl.constexpr,
     H: tl.constexpr,
@@ -30,15 +55,22 @@ def fused_chunk_retention_fwd_kernel(
     BV: tl.constexpr,
     USE_INITIAL_STATE: tl.constexpr,
     STORE_FINAL_STATE: tl.constexpr,
-    CHECK: tl.constexpr
+    HEAD_FIRST: tl.constexpr,
+    ALLOW_TF32: tl.constexpr
 ):
     # indices
     i_v, i_k, i_bh = tl.program_id(0), tl.program_id(1), tl.program_id(2)
-    i_h = i_bh % H
+    i_b, i_h = i_bh // H, i_bh % H
+
+    s_qk = K if HEAD_FIRST else H*K
+    s_vo = V if HEAD_FIRST else H*V
+    # offset calculation
+    o_qk = (i_bh * T*K) if HEAD_FIRST else ((i_b * T * H + i_h) * K)
+    o_vo = (i_bh * T*V) if HEAD_FIRST else ((i_b * T * H + i_h) * V)
 
     o_i = tl.arange(0, BT)
     # decay rate given the head index
-    b_b = tl.math.log2(1 - tl.math.exp2(-5 - i_h * 1.0))
+    b_b = tl.load(d + i_h)
 
     # d_b: overall decay for the entire chunk
     # d_o: cumulative decay from the start of the chunk
@@ -46,48 +78,47 @@ def fused_chunk_retention_fwd_kernel(
     d_b, d_o, d_h = tl.math.exp2(BT * b_b), tl.math.exp2((o_i + 1) * b_b), tl.math.exp2((BT - o_i - 1) * b_b)
 
     # [BT, BT]
-    m_s = o_i[:, None] >= o_i[None, :]
-    d_s = tl.where(m_s, tl.math.exp2((o_i[:, None] - o_i[None, :]) * b_b), 0)
+    p_ds = tl.make_block_ptr(ds + i_h * BT*BT, (BT, BT), (BT, 1), (0, 0), (BT, BT), (1, 0))
+    d_s = tl.load(p_ds)
     # [BK, BV]
     b_h = tl.zeros([BK, BV], dtype=tl.float32)
 
     # make block pointers
-    p_q = tl.make_block_ptr(q + i_bh * T*K, (T, K), (K, 1), (0, i_k * BK), (BT, BK), (1, 0))
-    p_k = tl.make_block_ptr(k + i_bh * T*K, (K, T), (1, K), (i_k * BK, 0), (BK, BT), (0, 1))
-    p_v = tl.make_block_ptr(v + i_bh * T*V, (T, V), (V, 1), (0, i_v * BV), (BT, BV), (1, 0))
-    p_o = tl.make_block_ptr(o + (i_k*B*H+i_bh).to(tl.int64) * T*V, (T, V), (V, 1), (0, i_v * BV), (BT, BV), (1, 0))
+    p_q = tl.make_block_ptr(q + o_qk, (T, K), (s_qk, 1), (0, i_k * BK), (BT, BK), (1, 0))
+    p_k = tl.make_block_ptr(k + o_qk, (T, K), (s_qk, 1), (0, i_k * BK), (BT, BK), (1, 0))
+    p_v = tl.make_block_ptr(v + o_vo, (T, V), (s_vo, 1), (0, i_v * BV), (BT, BV), (1, 0))
+    p_o = tl.make_block_ptr(o + i_k.to(tl.int64)*B*H*T*V + o_vo, (T, V), (s_vo, 1), (0, i_v * BV), (BT, BV), (1, 0))
 
     if USE_INITIAL_STATE:
         p_h = tl.make_block_ptr(h0 + i_bh * K * V, (K, V), (V, 1), (i_k * BK, i_v * BV), (BK, BV), (1, 0))
         b_h = tl.load(p_h, boundary_check=(0, 1)).to(tl.float32)
 
     NT = tl.cdiv(T, BT)
+    if T % BT != 0:
+        # decays of the last, partial chunk, only specialized for unaligned T
+        d_bt, d_ht = tl.math.exp2((T % BT) * b_b), tl.math.exp2(((T % BT) - o_i - 1) * b_b)
     for i in range(0, NT):
         # [BT, BK]
         b_q = tl.load(p_q, boundary_check=(0, 1))
         b_q = (b_q * scale).to(b_q.dtype)
-        # [BK, BT]
-        b_k = tl.load(p_k, boundary_check=(0, 1))
+        # [BK, BT], loaded row-major and transposed on chip
+        b_k = tl.trans(tl.load(p_k, boundary_check=(0, 1)))
         # [BT, BV]
         b_v = tl.load(p_v, boundary_check=(0, 1))
 
         # [BT, BT]
-        b_s = tl.dot(b_q, b_k, allow_tf32=False) * d_s
+        b_s = tl.dot(b_q, b_k, allow_tf32=ALLOW_TF32) * d_s
         # [BT, BV]
-        b_o = tl.dot(b_s.to(b_q.dtype), b_v, allow_tf32=False)
-        if CHECK and i == 0:
-            b_o += tl.dot(b_q, b_h.to(b_q.dtype), allow_tf32=False) * d_o[:, None]
-            b_h = d_b * b_h + tl.dot(b_k, (b_v * d_h[:, None]).to(b_k.dtype), allow_tf32=False)
-        else:
-            b_o += tl.dot(b_q, b_h.to(b_q.dtype), allow_tf32=False) * d_o[:, None]
-            if i == NT - 1 and (T % BT) != 0:
-                d_b = tl.math.exp2((T % BT) * b_b)
-                d_h = tl.math.exp2(((T % BT) - o_i - 1) * b_b)
-            b_h = d_b * b_h + tl.dot(b_k, (b_v * d_h[:, None]).to(b_k.dtype), allow_tf32=False)
+        b_o = tl.dot(b_s.to(b_q.dtype), b_v, allow_tf32=ALLOW_TF32)
+        if T % BT != 0:
+            if i == NT - 1:
+                d_b, d_h = d_bt, d_ht
+        b_o += tl.dot(b_q, b_h.to(b_q.dtype), allow_tf32=ALLOW_TF32) * d_o[:, None]
+        b_h = tl.dot((b_k * d_h[None, :]).to(b_k.dtype), b_v, acc=d_b * b_h, allow_tf32=ALLOW_TF32)
         tl.store(p_o, b_o.to(p_o.dtype.element_ty), boundary_check=(0, 1))
 
         p_q = tl.advance(p_q, (BT, 0))
-        p_k = tl.advance(p_k, (0, BT))
+        p_k = tl.advance(p_k, (BT, 0))
         p_v = tl.advance(p_v, (BT, 0))
         p_o = tl.advance(p_o, (BT, 0))
 
@@ -96,6 +127,15 @@ def fused_chunk_retention_fwd_kernel(
         tl.store(p_ht, b_h.to(p_ht.dtype.element_ty), boundary_check=(0, 1))
 
 
+@triton.autotune(
+    configs=[
+        triton.Config({}, num_warps=num_warps, num_stages=num_stages)
+        for num_warps in [2, 4, 8]
+        for num_stages in [1, 2, 3, 4]
+    ],
+    key=["BK", "BV"],
+    reset_to_zero=["dv"],
+)
 @triton.jit
 def fused_chunk_retention_bwd_kernel(
     q,
@@ -106,6 +146,10 @@ def fused_chunk_retention_bwd_kernel(
     dk,
     dv,
     h0,
+    dht,
+    dh0,
+    d,
+    ds,
     scale,
     B: tl.constexpr,
     H: tl.constexpr,
@@ -116,96 +160,136 @@ def fused_chunk_retention_bwd_kernel(
     BK: tl.constexpr,
     BV: tl.constexpr,
     USE_INITIAL_STATE: tl.constexpr,
+    STORE_INITIAL_STATE_GRADIENT: tl.constexpr,
+    USE_FINAL_STATE_GRADIENT: tl.constexpr,
+    HEAD_FIRST: tl.constexpr,
+    ALLOW_TF32: tl.constexpr,
     CHECK: tl.constexpr
 ):
     i_v, i_k, i_bh = tl.program_id(0), tl.program_id(1), tl.program_id(2)
-    i_h = i_bh % H
+    i_b, i_h = i_bh // H, i_bh % H
+
+    s_qk = K if HEAD_FIRST else H*K
+    s_vo = V if HEAD_FIRST else H*V
+    # offset calculation
+    o_qk = (i_bh * T*K) if HEAD_FIRST else ((i_b * T * H + i_h) * K)
+    o_vo = (i_bh * T*V) if HEAD_FIRST else ((i_b * T * H + i_h) * V)
 
     o_i = tl.arange(0, BT)
-    b_b = tl.math.log2(1 - tl.math.exp2(-5 - i_h * 1.0))
+    b_b = tl.load(d + i_h)
     d_q, d_k = tl.math.exp2((o_i+1) * b_b) * scale, tl.math.exp2((BT - o_i - 1) * b_b)
     d_b = tl.math.exp2(BT * b_b)
 
-    m_s = o_i[:, None] >= o_i[None, :]
-    d_s = tl.where(m_s, tl.math.exp2((o_i[:, None] - o_i[None, :]) * b_b), 0) * scale
+    p_ds = tl.make_block_ptr(ds + i_h * BT*BT, (BT, BT), (BT, 1), (0, 0), (BT, BT), (1, 0))
+    d_s = tl.load(p_ds) * scale
     # [BV, BK]
     b_h = tl.zeros([BV, BK], dtype=tl.float32)
     if USE_INITIAL_STATE:
         p_h = tl.make_block_ptr(h0 + i_bh * K * V, (V, K), (1, V), (i_v * BV, i_k * BK), (BV, BK), (0, 1))
         b_h = tl.load(p_h, boundary_check=(0, 1)).to(tl.float32)
 
+    p_k = tl.make_block_ptr(k + o_qk, (T, K), (s_qk, 1), (0, i_k * BK), (BT, BK), (1, 0))
+    p_v = tl.make_block_ptr(v + o_vo, (T, V), (s_vo, 1), (0, i_v * BV), (BT, BV), (1, 0))
+    p_do = tl.make_block_ptr(do + o_vo, (T, V), (s_vo, 1), (0, i_v * BV), (BT, BV), (1, 0))
+    p_dq = tl.make_block_ptr(dq + i_v.to(tl.int64)*B*H*T*K + o_qk, (T, K), (s_qk, 1), (0, i_k*BK), (BT, BK), (1, 0))
     for i in range(0, tl.cdiv(T, BT)):
-        p_k = tl.make_block_ptr(k + i_bh * T*K, (T, K), (K, 1), (i * BT, i_k * BK), (BT, BK), (1, 0))
-        p_v = tl.make_block_ptr(v + i_bh * T*V, (V, T), (1, V), (i_v * BV, i * BT), (BV, BT), (0, 1))
-        p_do = tl.make_block_ptr(do + i_bh * T*V, (T, V), (V, 1), (i * BT, i_v * BV), (BT, BV), (1, 0))
-        p_dq = tl.make_block_ptr(dq + (i_bh + i_v*B*H).to(tl.int64) * T*K, (T, K), (K, 1), (i*BT, i_k*BK), (BT, BK), (1, 0))
-
         # [BT, K]
         b_k = tl.load(p_k, boundary_check=(0, 1))
-        # [V, BT]
-        b_v = tl.load(p_v, boundary_check=(0, 1))
+        # [BV, BT]
+        b_v = tl.trans(tl.load(p_v, boundary_check=(0, 1)))
         # [BT, V]
         b_do = tl.load(p_do, boundary_check=(0, 1))
         b_dd = (b_do * d_q[:, None]).to(b_do.dtype)
 
         # [BT, BT]
-        b_ds = tl.dot(b_do, b_v, allow_tf32=False)
+        b_ds = tl.dot(b_do, b_v, allow_tf32=ALLOW_TF32)
         b_ds = (b_ds * d_s).to(b_k.dtype)
         # [BT, K]
-        b_dq = tl.dot(b_ds, b_k, allow_tf32=False)
+        b_dq = tl.dot(b_ds, b_k, allow_tf32=ALLOW_TF32)
         # [V, K]
         if CHECK and i == 0:
-            b_dq += tl.dot(b_dd, b_h.to(b_k.dtype), allow_tf32=False)
-            b_h = d_b * b_h + tl.dot((b_v * d_k[None, :]).to(b_k.dtype), b_k, allow_tf32=False)
+            b_dq = tl.dot(b_dd, b_h.to(b_k.dtype), acc=b_dq, allow_tf32=ALLOW_TF32)
+            b_h = tl.dot((b_v * d_k[None, :]).to(b_k.dtype), b_k, acc=d_b * b_h, allow_tf32=ALLOW_TF32)
         else:
-            b_dq += tl.dot(b_dd, b_h.to(b_k.dtype), allow_tf32=False)
-            b_h = d_b * b_h + tl.dot((b_v * d_k[None, :]).to(b_k.dtype), b_k, allow_tf32=False)
+            b_dq = tl.dot(b_dd, b_h.to(b_k.dtype), acc=b_dq, allow_tf32=ALLOW_TF32)
+            b_h = tl.dot((b_v * d_k[None, :]).to(b_k.dtype), b_k, acc=d_b * b_h, allow_tf32=ALLOW_TF32)
 
         tl.store(p_dq, b_dq.to(p_dq.dtype.element_ty), boundary_check=(0, 1))
 
+        p_k = tl.advance(p_k, (BT, 0))
+        p_v = tl.advance(p_v, (BT, 0))
+        p_do = tl.advance(p_do, (BT, 0))
+        p_dq = tl.advance(p_dq, (BT, 0))
+
     # sync threads
     b_h = None
     tl.debug_barrier()
     d_s = tl.trans(d_s)
     # [BK, BV]
     b_dh = tl.zeros([BK, BV], dtype=tl.float32)
+    if USE_FINAL_STATE_GRADIENT:
+        p_dht = tl.make_block_ptr(dht + i_bh * K * V, (K, V), (V, 1), (i_k * BK, i_v * BV), (BK, BV), (1, 0))
+        b_dh += tl.load(p_dht, boundary_check=(0, 1)).to(tl.float32)
+    # walk the chunks backwards, starting from the one that ends at T
+    p_q = tl.make_block_ptr(q + o_qk, (T, K), (s_qk, 1), (T - BT, i_k * BK), (BT, BK), (1, 0))
+    p_k = tl.make_block_ptr(k + o_qk, (T, K), (s_qk, 1), (T - BT, i_k * BK), (BT, BK), (1, 0))
+    p_v = tl.make_block_ptr(v + o_vo, (T, V), (s_vo, 1), (T - BT, i_v * BV), (BT, BV), (1, 0))
+    p_do = tl.make_block_ptr(do + o_vo, (T, V), (s_vo, 1), (T - BT, i_v * BV), (BT, BV), (1, 0))
+    p_dk = tl.make_block_ptr(dk + i_v.to(tl.int64)*B*H*T*K + o_qk, (T, K), (s_qk, 1), (T - BT, i_k*BK), (BT, BK), (1, 0))
+    if (K + BK - 1) // BK == 1:
+        p_dv = tl.make_block_ptr(dv + o_vo, (T, V), (s_vo, 1), (T - BT, i_v * BV), (BT, BV), (1, 0))
+    else:
+        o_v = i_v * BV + tl.arange(0, BV)
     for i in range(1, tl.cdiv(T, BT) + 1):
-        p_q = tl.make_block_ptr(q + i_bh * T*K, (K, T), (1, K), (i_k * BK, T - i * BT), (BK, BT), (0, 1))
-        p_k = tl.make_block_ptr(k + i_bh * T*K, (T, K), (K, 1), (T - i * BT, i_k * BK), (BT, BK), (1, 0))
-        p_v = tl.make_block_ptr(v + i_bh * T*V, (T, V), (V, 1), (T - i * BT, i_v * BV), (BT, BV), (1, 0))
-        p_do = tl.make_block_ptr(do + i_bh * T*V, (T, V), (V, 1), (T - i * BT, i_v * BV), (BT, BV), (1, 0))
-        p_dk = tl.make_block_ptr(dk + (i_bh+i_v*B*H).to(tl.int64) * T*K, (T, K), (K, 1), (T - i*BT, i_k*BK), (BT, BK), (1, 0))
-        p_dv = tl.make_block_ptr(dv + (i_bh+i_k*B*H).to(tl.int64) * T*V, (T, V), (V, 1), (T - i*BT, i_v*BV), (BT, BV), (1, 0))
-        # [K, BT]
+        # [BT, BK]
         b_q = tl.load(p_q, boundary_check=(0, 1))
         # [BT, BK]
         b_k = tl.load(p_k, boundary_check=(0, 1))
         # [BT, BV]
         b_v = tl.load(p_v, boundary_check=(0, 1))
         b_do = tl.load(p_do, boundary_check=(0, 1))
-        b_dd = (b_do * d_q[:, None]).to(b_do.dtype)
 
         # [BT, BT]
-        b_ds = tl.dot(b_v, tl.trans(b_do), allow_tf32=False)
+        b_ds = tl.dot(b_v, tl.trans(b_do), allow_tf32=ALLOW_TF32)
         b_ds = (b_ds * d_s).to(b_k.dtype)
 
         # [BT, BT]
-        b_s = tl.dot(b_k, b_q, allow_tf32=False) * d_s
+        b_s = tl.dot(b_k, tl.trans(b_q), allow_tf32=ALLOW_TF32) * d_s
         # [BT, BK]
-        b_dk = tl.dot(b_ds, tl.trans(b_q), allow_tf32=False)
+        b_dk = tl.dot(b_ds, b_q, allow_tf32=ALLOW_TF32)
         # [BT, BV]
-        b_dv = tl.dot(b_s.to(b_q.dtype), b_do, allow_tf32=False)
+        b_dv = tl.dot(b_s.to(b_q.dtype), b_do, allow_tf32=ALLOW_TF32)
         if CHECK and i == 1:
-            b_dk += tl.dot(b_v, tl.trans(b_dh).to(b_v.dtype), allow_tf32=False) * d_k[:, None]
-            b_dv += tl.dot(b_k, b_dh.to(b_k.dtype), allow_tf32=False) * d_k[:, None]
-            b_dh = d_b * b_dh + tl.dot(b_q, b_dd, allow_tf32=False)
+            b_dk += tl.dot(b_v, tl.trans(b_dh).to(b_v.dtype), allow_tf32=ALLOW_TF32) * d_k[:, None]
+            b_dv += tl.dot(b_k, b_dh.to(b_k.dtype), allow_tf32=ALLOW_TF32) * d_k[:, None]
+            b_dh = tl.dot(tl.trans((b_q * d_q[:, None]).to(b_q.dtype)), b_do, acc=d_b * b_dh, allow_tf32=ALLOW_TF32)
         else:
-            b_dk += tl.dot(b_v, tl.trans(b_dh).to(b_v.dtype), allow_tf32=False) * d_k[:, None]
-            b_dv += tl.dot(b_k, b_dh.to(b_k.dtype), allow_tf32=False) * d_k[:, None]
-            b_dh = d_b * b_dh + tl.dot(b_q, b_dd, allow_tf32=False)
+            b_dk += tl.dot(b_v, tl.trans(b_dh).to(b_v.dtype), allow_tf32=ALLOW_TF32) * d_k[:, None]
+            b_dv += tl.dot(b_k, b_dh.to(b_k.dtype), allow_tf32=ALLOW_TF32) * d_k[:, None]
+            b_dh = tl.dot(tl.trans((b_q * d_q[:, None]).to(b_q.dtype)), b_do, acc=d_b * b_dh, allow_tf32=ALLOW_TF32)
 
         tl.store(p_dk, b_dk.to(p_dk.dtype.element_ty), boundary_check=(0, 1))
-        tl.store(p_dv, b_dv.to(p_dv.dtype.element_ty), boundary_check=(0, 1))
+        if (K + BK - 1) // BK == 1:
+            tl.store(p_dv, b_dv.to(p_dv.dtype.element_ty), boundary_check=(0, 1))
+            p_dv = tl.advance(p_dv, (-BT, 0))
+        else:
+            # the partial dv of all K blocks are accumulated in place
+            o_t = T - i * BT + o_i
+            m_dv = (o_t[:, None] >= 0) & (o_v[None, :] < V)
+            tl.atomic_add(dv + o_vo + o_t[:, None] * s_vo + o_v[None, :], b_dv, mask=m_dv)
+
+        p_q = tl.advance(p_q, (-BT, 0))
+        p_k = tl.advance(p_k, (-BT, 0))
+        p_v = tl.advance(p_v, (-BT, 0))
+        p_do = tl.advance(p_do, (-BT, 0))
+        p_dk = tl.advance(p_dk, (-BT, 0))
+
+    if STORE_INITIAL_STATE_GRADIENT:
+        # the last chunk visited starts at T - NT*BT <= 0, so b_dh is the gradient of the state at that position,
+        # which is brought back to the initial state by the decay of the (T - NT*BT) missing steps
+        p_dh0 = tl.make_block_ptr(dh0 + i_bh * K * V, (K, V), (V, 1), (i_k * BK, i_v * BV), (BK, BV), (1, 0))
+        b_dh = b_dh * tl.math.exp2((T - tl.cdiv(T, BT) * BT) * b_b)
+        tl.store(p_dh0, b_dh.to(p_dh0.dtype.element_ty), boundary_check=(0, 1))
 
 
 class FusedChunkRetentionFunction(torch.autograd.Function):
@@ -213,16 +297,17 @@ class FusedChunkRetentionFunction(torch.autograd.Function):
     @staticmethod
     @contiguous
     @autocast_custom_fwd
-    def forward(ctx, q, k, v, scale, initial_state, output_final_state):
-        B, H, T, K, V = *k.shape, v.shape[-1]
+    def forward(ctx, q, k, v, scale, initial_state, output_final_state, head_first=True):
+        if head_first:
+            B, H, T, K, V = *k.shape, v.shape[-1]
+        else:
+            B, T, H, K, V = *k.shape, v.shape[-1]
 
         BT = 64
         BK, BV = min(triton.next_power_of_2(K), 64), min(triton.next_power_of_2(V), 64)
         NK, NV = triton.cdiv(K, BK), triton.cdiv(V, BV)
-        num_stages = 1
-        num_warps = 4
 
-        o = q.new_empty(NK, B, H, T, V)
+        o = q.new_empty(NK, *v.shape)
 
         if output_final_state:
             final_state = q.new_empty(B, H, K, V, dtype=torch.float, requires_grad=False)
@@ -242,6 +327,8 @@ class FusedChunkRetentionFunction(torch.autograd.Function):
             )
             CHECK = True
 
+        # fp32 inputs go through tf32 tensor cores only if allowed by the global torch setting
+        ctx.allow_tf32 = torch.backends.cuda.matmul.allow_tf32
         grid = (NV, NK, B * H)
         fused_chunk_retention_fwd_kernel[grid](
             q,
@@ -250,6 +337,8 @@ class FusedChunkRetentionFunction(torch.autograd.Function):
             o,
             initial_state,
             final_state,
+            prepare_log_decay(H, q.device),
+            prepare_chunk_decay(H, BT, q.device),
             scale,
             B=B,
             H=H,
@@ -261,14 +350,15 @@ class FusedChunkRetentionFunction(torch.autograd.Function):
             BV=BV,
             USE_INITIAL_STATE=initial_state is not None,
             STORE_FINAL_STATE=output_final_state,
-            CHECK=CHECK,
-            num_warps=num_warps,
-            num_stages=num_stages
+            HEAD_FIRST=head_first,
+            ALLOW_TF32=ctx.allow_tf32
         )
 
         o = o.sum(0)
         ctx.save_for_backward(q, k, v, initial_state)
+        ctx.scale = scale
         ctx.CHECK = CHECK
+        ctx.head_first = head_first
         return o.to(q.dtype), final_state
 
     @staticmethod
@@ -276,18 +366,21 @@ class FusedChunkRetentionFunction(torch.autograd.Function):
     @autocast_custom_bwd
     def backward(ctx, do, dht=None):
         q, k, v, initial_state = ctx.saved_tensors
-        B, H, T, K, V = *k.shape, v.shape[-1]
-        scale = K ** -0.5
+        if ctx.head_first:
+            B, H, T, K, V = *k.shape, v.shape[-1]
+        else:
+            B, T, H, K, V = *k.shape, v.shape[-1]
+        scale = ctx.scale
 
         BT = 64
         BK, BV = min(triton.next_power_of_2(K), 64), min(triton.next_power_of_2(V), 64)
         NK, NV = triton.cdiv(K, BK), triton.cdiv(V, BV)
-        num_stages = 1
-        num_warps = 4
 
-        dq = q.new_empty(NV, B, H, T, K)
-        dk = q.new_empty(NV, B, H, T, K)
-        dv = q.new_empty(NK, B, H, T, V)
+        dq = q.new_empty(NV, *q.shape)
+        dk = q.new_empty(NV, *k.shape)
+        # dv is written directly for a single K block, and accumulated atomically in fp32 otherwise
+        dv = torch.empty_like(v) if NK == 1 else torch.zeros_like(v, dtype=torch.float)
+        dh0 = torch.empty_like(initial_state, dtype=torch.float) if initial_state is not None else None
         grid = (NV, NK, B * H)
 
         fused_chunk_retention_bwd_kernel[grid](
@@ -299,6 +392,10 @@ class FusedChunkRetentionFunction(torch.autograd.Function):
             dk,
             dv,
             initial_state,
+            dht,
+            dh0,
+            prepare_log_decay(H, q.device),
+            prepare_chunk_decay(H, BT, q.device),
             scale,
             B=B,
             T=T,
@@ -309,14 +406,17 @@ class FusedChunkRetentionFunction(torch.autograd.Function):
             BK=BK,
             BV=BV,
             USE_INITIAL_STATE=initial_state is not None,
-            CHECK=ctx.CHECK,
-            num_warps=num_warps,
-            num_stages=num_stages
+            STORE_INITIAL_STATE_GRADIENT=initial_state is not None,
+            USE_FINAL_STATE_GRADIENT=dht is not None,
+            HEAD_FIRST=ctx.head_first,
+            ALLOW_TF32=ctx.allow_tf32,
+            CHECK=ctx.CHECK
         )
         dq = dq.sum(0)
         dk = dk.sum(0)
-        dv = dv.sum(0)
-        return dq.to(q.dtype), dk.to(k.dtype), dv.to(v.dtype), None, None, None
+        if dh0 is not None:
+            dh0 = dh0.to(initial_state.dtype)
+        return dq.to(q.dtype), dk.to(k.dtype), dv.to(v.dtype), None, dh0, None, None
 
 
 def fused_chunk_retention(
@@ -355,11 +455,5 @@ def fused_chunk_retention(
     """
     if scale is None:
         scale = k.shape[-1] ** -0.5
-    if not head_first:
-        q = q.transpose(1, 2)
-        k = k.transpose(1, 2)
-        v = v.transpose(1, 2)
-    o, final_state = FusedChunkRetentionFunction.apply(q, k, v, scale, initial_state, output_final_state)
-    if not head_first:
-        o = o.transpose(1, 2)
+    o, final_state = FusedChunkRetentionFunction.apply(q, k, v, scale, initial_state, output_final_state, head_first)
     return o, final_state
@@ -23,8 +23,9 @@ def chunk_simple_gla_fwd(
     offsets: Optional[torch.LongTensor] = None,
     indices: Optional[torch.LongTensor] = None,
     head_first: bool = True,
-    chunk_size: int = 64
-) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    chunk_size: int = 64,
+    states_in_fp32: bool = False
+) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
     g = chunk_local_cumsum(g, chunk_size, offsets=offsets, head_first=head_first) if g is not None else None
     h, ht = chunk_fwd_h(
         k=k,
@@ -34,7 +35,7 @@ def chunk_simple_gla_fwd(
         gv=None,
         h0=initial_state,
         output_final_state=output_final_state,
-        states_in_fp32=False,
+        states_in_fp32=states_in_fp32,
         offsets=offsets,
         indices=indices,
         head_first=head_first,
@@ -52,7 +53,7 @@ def chunk_simple_gla_fwd(
         head_first=head_first,
         chunk_size=chunk_size
     )
-    return g, o, ht
+    return g, o, h, ht
 
 
 def chunk_simple_gla_bwd(
@@ -64,26 +65,28 @@ def chunk_simple_gla_bwd(
     do: torch.Tensor,
     dht: torch.Tensor,
     scale: float,
+    h: Optional[torch.Tensor] = None,
     offsets: Optional[torch.LongTensor] = None,
     indices: Optional[torch.LongTensor] = None,
     head_first: bool = True,
     chunk_size: int = 64
 ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
-    # (SY 09/22) states_in_fp32 seems not affecting the error of dg but for safety, set to True
-    h, _ = chunk_fwd_h(
-        k=k,
-        v=v,
-        g=g,
-        gk=None,
-        gv=None,
-        h0=initial_state,
-        output_final_state=False,
-        states_in_fp32=True,
-        offsets=offsets,
-        indices=indices,
-        head_first=head_first,
-        chunk_size=chunk_size
-    )
+    if h is None:
+        # (SY 09/22) states_in_fp32 seems not affecting the error of dg but for safety, set to True
+        h, _ = chunk_fwd_h(
+            k=k,
+            v=v,
+            g=g,
+            gk=None,
+            gv=None,
+            h0=initial_state,
+            output_final_state=False,
+            states_in_fp32=True,
+            offsets=offsets,
+            indices=indices,
+            head_first=head_first,
+            chunk_size=chunk_size
+        )
     dh, dh0 = chunk_bwd_dh(
         q=q,
         k=k,
@@ -145,7 +148,8 @@ class ChunkSimpleGLAFunction(torch.autograd.Function):
         initial_state,
         output_final_state,
         offsets,
-        head_first
+        head_first,
+        checkpoint_level
     ):
         T = q.shape[2] if head_first else q.shape[1]
         chunk_size = min(64, max(16, triton.next_power_of_2(T)))
@@ -159,7 +163,7 @@ class ChunkSimpleGLAFunction(torch.autograd.Function):
             indices = torch.cat([torch.arange(n) for n in triton.cdiv(offsets[1:] - offsets[:-1], chunk_size).tolist()])
             indices = torch.stack([indices.eq(0).cumsum(0) - 1, indices], 1).to(offsets)
 
-        g, o, ht = chunk_simple_gla_fwd(
+        g, o, h, ht = chunk_simple_gla_fwd(
             q=q,
             k=k,
             v=v,
@@ -170,9 +174,14 @@ class ChunkSimpleGLAFunction(torch.autograd.Function):
             offsets=offsets,
             indices=indices,
             head_first=head_first,
-            chunk_size=chunk_size
+            chunk_size=chunk_size,
+            # the saved states are reused by backward, which expects them in fp32
+            states_in_fp32=checkpoint_level == 0
         )
-        ctx.save_for_backward(q, k, v, g, initial_state)
+        if checkpoint_level > 0:
+            del h
+            h = None
+        ctx.save_for_backward(q, k, v, g, initial_state, h)
         ctx.chunk_size = chunk_size
         ctx.scale = scale
         ctx.offsets = offsets
@@ -185,7 +194,7 @@ class ChunkSimpleGLAFunction(torch.autograd.Function):
     @autocast_custom_bwd
     def backward(ctx, do, dht):
         chunk_size, scale, offsets, indices, head_first = ctx.chunk_size, ctx.scale, ctx.offsets, ctx.indices, ctx.head_first
-        q, k, v, g, initial_state = ctx.saved_tensors
+        q, k, v, g, initial_state, h = ctx.saved_tensors
         dq, dk, dv, dg, dh0 = chunk_simple_gla_bwd(
             q=q,
             k=k,
@@ -195,6 +204,7 @@ class ChunkSimpleGLAFunction(torch.autograd.Function):
             do=do,
             dht=dht,
             scale=scale,
+            h=h,
             offsets=offsets,
             indices=indices,
             head_first=head_first,
@@ -204,7 +214,7 @@ class ChunkSimpleGLAFunction(torch.autograd.Function):
             dg = chunk_local_cumsum(dg, chunk_size, reverse=True, offsets=offsets, head_first=head_first).to(g.dtype)
         else:
             dg = None
-        return dq.to(q.dtype), dk.to(k.dtype), dv.to(v.dtype), dg, None, dh0, None, None, None
+        return dq.to(q.dtype), dk.to(k.dtype), dv.to(v.dtype), dg, None, dh0, None, None, None, None
 
 
 def chunk_simple_gla(
@@ -216,7 +226,8 @@ def chunk_simple_gla(
     initial_state: Optional[torch.Tensor] = None,
     output_final_state: bool = False,
     cu_seqlens: Optional[torch.LongTensor] = None,
-    head_first: bool = True
+    head_first: bool = True,
+    checkpoint_level: int = 1
 ) -> Tuple[torch.Tensor, torch.Tensor]:
     r"""
     Args:
@@ -244,6 +255,11 @@ def chunk_simple_gla(
         head_first (Optional[bool]):
             Whether the inputs are in the head-first format, which is not supported for variable-length inputs.
             Default: `True`.
+        checkpoint_level (Optional[int]):
+            Checkpointing level; higher values will save more memories and do more recomputations during backward.
+            Default: `1`:
+            - Level `0`: save the fp32 chunk-level hidden states for backward, no recomputation.
+            - Level `1`: recompute the chunk-level hidden states during backward.
 
     Returns:
         o (torch.Tensor):
@@ -287,6 +303,7 @@ def chunk_simple_gla(
         if initial_state is not None and initial_state.shape[0] != len(cu_seqlens) - 1:
             raise ValueError(f"The number of initial states is expected to be equal to the number of input sequences, "
                              f"i.e., {len(cu_seqlens) - 1} rather than {initial_state.shape[0]}.")
+    assert checkpoint_level in [0, 1]
     if scale is None:
         scale = k.shape[-1] ** -0.5
     o, final_state = ChunkSimpleGLAFunction.apply(
@@ -298,6 +315,7 @@ def chunk_simple_gla(
         initial_state,
         output_final_state,
         cu_seqlens,
-        head_first
+        head_first,
+        checkpoint_level
     )
     return o, final_state
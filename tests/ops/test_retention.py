@@ -5,8 +5,8 @@ import os
 import pytest
 import torch
 
-from fla.ops.retention import (chunk_retention, fused_recurrent_retention,
-                               parallel_retention)
+from fla.ops.retention import (chunk_retention, fused_chunk_retention,
+                               fused_recurrent_retention, parallel_retention)
 from fla.ops.retention.naive import naive_retention
 
 
@@ -77,6 +77,177 @@ def test_chunk(
     assert_close("dv", ref_dv, tri_dv, 0.005)
 
 
+@pytest.mark.parametrize("B", [2])
+@pytest.mark.parametrize("H", [4])
+@pytest.mark.parametrize("T", [63, 300])
+@pytest.mark.parametrize("D", [64, 100])
+@pytest.mark.parametrize("scale", [0.1])
+@pytest.mark.parametrize("dtype", [torch.float32])
+def test_fused_chunk_state_gradients(
+    B: int,
+    H: int,
+    T: int,
+    D: int,
+    scale: float,
+    dtype: torch.dtype
+):
+    # a custom scale, an initial state and a final-state gradient all flow into the fused backward
+    torch.manual_seed(42)
+    os.environ['TRITON_F32_DEFAULT'] = 'ieee'
+
+    q = torch.randn((B, H, T, D), dtype=dtype, device='cuda').requires_grad_()
+    k = torch.randn((B, H, T, D), dtype=dtype, device='cuda').requires_grad_()
+    v = torch.randn((B, H, T, D), dtype=dtype, device='cuda').requires_grad_()
+    h0 = torch.randn((B, H, D, D), dtype=torch.float32, device='cuda').requires_grad_()
+    do = torch.randn_like(v)
+    dht = torch.randn((B, H, D, D), dtype=torch.float32, device='cuda')
+
+    ref, ref_ht = fused_recurrent_retention(q, k, v, scale=scale, initial_state=h0, output_final_state=True)
+    ((ref * do).sum() + (ref_ht * dht).sum()).backward()
+    ref_dq, q.grad = q.grad.clone(), None
+    ref_dk, k.grad = k.grad.clone(), None
+    ref_dv, v.grad = v.grad.clone(), None
+    ref_dh0, h0.grad = h0.grad.clone(), None
+
+    tri, tri_ht = fused_chunk_retention(q, k, v, scale=scale, initial_state=h0, output_final_state=True)
+    ((tri * do).sum() + (tri_ht * dht).sum()).backward()
+    tri_dq, q.grad = q.grad.clone(), None
+    tri_dk, k.grad = k.grad.clone(), None
+    tri_dv, v.grad = v.grad.clone(), None
+    tri_dh0, h0.grad = h0.grad.clone(), None
+
+    assert_close("  o", ref, tri, 0.005)
+    assert_close(" ht", ref_ht, tri_ht, 0.005)
+    assert_close(" dq", ref_dq, tri_dq, 0.005)
+    assert_close(" dk", ref_dk, tri_dk, 0.005)
+    assert_close(" dv", ref_dv, tri_dv, 0.005)
+    assert_close("dh0", ref_dh0, tri_dh0, 0.005)
+
+
+@pytest.mark.parametrize("B", [2])
+@pytest.mark.parametrize("H", [4])
+@pytest.mark.parametrize("T", [63, 300, 512])
+@pytest.mark.parametrize("D", [64, 100, 128, 256])
+@pytest.mark.parametrize("use_h0", [False, True])
+@pytest.mark.parametrize("head_first", [True, False])
+@pytest.mark.parametrize("dtype", [torch.bfloat16, torch.float32])
+def test_fused_chunk(
+    B: int,
+    H: int,
+    T: int,
+    D: int,
+    use_h0: bool,
+    head_first: bool,
+    dtype: torch.dtype
+):
+    torch.manual_seed(42)
+    os.environ['TRITON_F32_DEFAULT'] = 'ieee'
+
+    if head_first:
+        q = torch.randn((B, H, T, D), dtype=dtype, device='cuda').requires_grad_()
+        k = torch.randn((B, H, T, D), dtype=dtype, device='cuda').requires_grad_()
+        v = torch.randn((B, H, T, D), dtype=dtype, device='cuda').requires_grad_()
+    else:
+        q = torch.randn((B, T, H, D), dtype=dtype, device='cuda').requires_grad_()
+        k = torch.randn((B, T, H, D), dtype=dtype, device='cuda').requires_grad_()
+        v = torch.randn((B, T, H, D), dtype=dtype, device='cuda').requires_grad_()
+    h0 = torch.randn((B, H, D, D), dtype=torch.float32, device='cuda').requires_grad_() if use_h0 else None
+    do = torch.randn_like(v)
+    dht = torch.randn((B, H, D, D), dtype=torch.float32, device='cuda')
+    ratio = 0.005 if dtype == torch.float32 else 0.01
+
+    ref, ref_ht = fused_recurrent_retention(q, k, v, initial_state=h0, output_final_state=True, head_first=head_first)
+    ((ref * do).sum() + (ref_ht * dht).sum()).backward()
+    ref_dq, q.grad = q.grad.clone(), None
+    ref_dk, k.grad = k.grad.clone(), None
+    ref_dv, v.grad = v.grad.clone(), None
+    if use_h0:
+        ref_dh0, h0.grad = h0.grad.clone(), None
+
+    tri, tri_ht = fused_chunk_retention(q, k, v, initial_state=h0, output_final_state=True, head_first=head_first)
+    ((tri * do).sum() + (tri_ht * dht).sum()).backward()
+    tri_dq, q.grad = q.grad.clone(), None
+    tri_dk, k.grad = k.grad.clone(), None
+    tri_dv, v.grad = v.grad.clone(), None
+    if use_h0:
+        tri_dh0, h0.grad = h0.grad.clone(), None
+
+    assert_close("  o", ref, tri, ratio)
+    assert_close(" ht", ref_ht, tri_ht, ratio)
+    assert_close(" dq", ref_dq, tri_dq, ratio)
+    assert_close(" dk", ref_dk, tri_dk, ratio)
+    assert_close(" dv", ref_dv, tri_dv, ratio)
+    if use_h0:
+        assert_close("dh0", ref_dh0, tri_dh0, ratio)
+
+
+@pytest.mark.parametrize("B", [2])
+@pytest.mark.parametrize("H", [4])
+@pytest.mark.parametrize("T", [63, 300])
+@pytest.mark.parametrize("K", [100, 256])
+@pytest.mark.parametrize("V", [64, 100])
+@pytest.mark.parametrize("dtype", [torch.bfloat16, torch.float32])
+def test_fused_chunk_dv(
+    B: int,
+    H: int,
+    T: int,
+    K: int,
+    V: int,
+    dtype: torch.dtype
+):
+    # with K > 64 the dv of several K blocks are accumulated atomically,
+    # which also has to survive the replays of the first, autotuning call
+    from fla.ops.retention.fused_chunk import fused_chunk_retention_bwd_kernel
+
+    torch.manual_seed(42)
+    os.environ['TRITON_F32_DEFAULT'] = 'ieee'
+
+    q = torch.randn((B, H, T, K), dtype=dtype, device='cuda').requires_grad_()
+    k = torch.randn((B, H, T, K), dtype=dtype, device='cuda').requires_grad_()
+    v = torch.randn((B, H, T, V), dtype=dtype, device='cuda').requires_grad_()
+    do = torch.randn_like(v)
+    ratio = 0.005 if dtype == torch.float32 else 0.01
+
+    ref, _ = fused_recurrent_retention(q, k, v)
+    ref.backward(do)
+    ref_dv, v.grad = v.grad.clone(), None
+
+    fused_chunk_retention_bwd_kernel.cache.clear()
+    for _ in range(2):
+        tri, _ = fused_chunk_retention(q, k, v)
+        tri.backward(do)
+        tri_dv, v.grad = v.grad.clone(), None
+        assert_close("dv", ref_dv, tri_dv, ratio)
+
+
+@pytest.mark.parametrize("B", [2])
+@pytest.mark.parametrize("H", [4])
+@pytest.mark.parametrize("T", [1, 63])
+@pytest.mark.parametrize("D", [64, 100])
+@pytest.mark.parametrize("dtype", [torch.bfloat16, torch.float32])
+def test_fused_chunk_short(
+    B: int,
+    H: int,
+    T: int,
+    D: int,
+    dtype: torch.dtype
+):
+    # a single partial chunk, whose final state must only be decayed by the T steps it covers
+    torch.manual_seed(42)
+    os.environ['TRITON_F32_DEFAULT'] = 'ieee'
+
+    q = torch.randn((B, H, T, D), dtype=dtype, device='cuda')
+    k = torch.randn((B, H, T, D), dtype=dtype, device='cuda')
+    v = torch.randn((B, H, T, D), dtype=dtype, device='cuda')
+    h0 = torch.randn((B, H, D, D), dtype=torch.float32, device='cuda')
+    ratio = 0.005 if dtype == torch.float32 else 0.01
+
+    ref, ref_ht = fused_recurrent_retention(q, k, v, initial_state=h0, output_final_state=True)
+    tri, tri_ht = fused_chunk_retention(q, k, v, initial_state=h0, output_final_state=True)
+    assert_close(" o", ref, tri, ratio)
+    assert_close("ht", ref_ht, tri_ht, ratio)
+
+
 @pytest.mark.parametrize("N", [4])
 @pytest.mark.parametrize("T", [64, 128, 200, 250, 256, 300, 400, 512, 1000, 2048])
 @pytest.mark.parametrize("H", [4])
@@ -147,6 +318,64 @@ def test_chunk_varlen(
     assert_close("dh0", ref_dh0, tri_dh0, 0.005)
 
 
+@pytest.mark.parametrize("T", [300, 512])
+@pytest.mark.parametrize("H", [4])
+@pytest.mark.parametrize("D", [64, 100])
+@pytest.mark.parametrize("use_offsets", [False, True])
+@pytest.mark.parametrize("dtype", [torch.bfloat16])
+def test_chunk_checkpoint_level(
+    T: int,
+    H: int,
+    D: int,
+    use_offsets: bool,
+    dtype: torch.dtype
+):
+    torch.manual_seed(42)
+    os.environ['TRITON_F32_DEFAULT'] = 'ieee'
+
+    if use_offsets:
+        N, B = 4, 1
+        # randomly split the sequence into N segments
+        offsets = torch.cat([
+            torch.tensor([0], dtype=torch.long),
+            torch.arange(16, T)[torch.randperm(T - 1)[:N-1]],
+            torch.tensor([T], dtype=torch.long)
+        ], 0).cuda().sort()[0]
+    else:
+        N, B = 2, 2
+        offsets = None
+    q = torch.randn((B, T, H, D), dtype=dtype, device='cuda').requires_grad_()
+    k = torch.randn((B, T, H, D), dtype=dtype, device='cuda').requires_grad_()
+    v = torch.randn((B, T, H, D), dtype=dtype, device='cuda').requires_grad_()
+    h0 = torch.randn((N, H, D, D), dtype=torch.float32, device='cuda').requires_grad_()
+    do = torch.randn_like(v)
+    dht = torch.randn_like(h0)
+
+    outputs = []
+    for checkpoint_level in [1, 0]:
+        o, ht = chunk_retention(q, k, v,
+                                initial_state=h0,
+                                output_final_state=True,
+                                cu_seqlens=offsets,
+                                head_first=False,
+                                checkpoint_level=checkpoint_level)
+        ((o * do).sum() + (ht * dht).sum()).backward()
+        grads = []
+        for x in (q, k, v, h0):
+            grads.append(x.grad.clone())
+            x.grad = None
+        outputs.append((o, ht, *grads))
+
+    # the levels keep h in different dtypes, so the kernels consuming it are autotuned separately.
+    # they may pick different tile sizes and accumulate in a different order,
+    # so the results are close rather than bitwise equal
+    for name, ref, tri in zip(("o", "ht", "dq", "dk", "dv", "dh0"), *outputs):
+        assert_close(name, ref, tri, 0.002)
+
+    with pytest.raises(AssertionError):
+        chunk_retention(q, k, v, head_first=False, checkpoint_level=2)
+
+
 @pytest.mark.parametrize("B", [4])
 @pytest.mark.parametrize("H", [4])
 @pytest.mark.parametrize("T", [300, 512])
@@ -225,6 +225,65 @@ def test_chunk_varlen(
     assert_close("dh0", ref_dh0, tri_dh0, 0.005)
 
 
+@pytest.mark.parametrize("T", [300, 512])
+@pytest.mark.parametrize("H", [4])
+@pytest.mark.parametrize("D", [64, 100])
+@pytest.mark.parametrize("use_offsets", [False, True])
+@pytest.mark.parametrize("dtype", [torch.bfloat16])
+def test_chunk_checkpoint_level(
+    T: int,
+    H: int,
+    D: int,
+    use_offsets: bool,
+    dtype: torch.dtype
+):
+    torch.manual_seed(42)
+    os.environ['TRITON_F32_DEFAULT'] = 'ieee'
+
+    if use_offsets:
+        N, B = 4, 1
+        # randomly split the sequence into N segments
+        offsets = torch.cat([
+            torch.tensor([0], dtype=torch.long),
+            torch.arange(16, T)[torch.randperm(T - 1)[:N-1]],
+            torch.tensor([T], dtype=torch.long)
+        ], 0).cuda().sort()[0]
+    else:
+        N, B = 2, 2
+        offsets = None
+    q = torch.randn((B, T, H, D), dtype=dtype, device='cuda').requires_grad_()
+    k = torch.randn((B, T, H, D), dtype=dtype, device='cuda').requires_grad_()
+    v = torch.randn((B, T, H, D), dtype=dtype, device='cuda').requires_grad_()
+    g = F.logsigmoid(torch.randn((B, T, H), dtype=torch.float32, device='cuda')).requires_grad_()
+    h0 = torch.randn((N, H, D, D), dtype=torch.float32, device='cuda').requires_grad_()
+    do = torch.randn_like(v)
+    dht = torch.randn_like(h0)
+
+    outputs = []
+    for checkpoint_level in [1, 0]:
+        o, ht = chunk_simple_gla(q, k, v, g,
+                                 initial_state=h0,
+                                 output_final_state=True,
+                                 cu_seqlens=offsets,
+                                 head_first=False,
+                                 checkpoint_level=checkpoint_level)
+        ((o * do).sum() + (ht * dht).sum()).backward()
+        grads = []
+        for x in (q, k, v, g, h0):
+            grads.append(x.grad.clone())
+            x.grad = None
+        outputs.append((o, ht, *grads))
+
+    # the levels keep h in different dtypes, so the kernels consuming it are autotuned separately.
+    # they may pick different tile sizes and accumulate in a different order,
+    # so the results are close rather than bitwise equal
+    for name, ref, tri in zip(("o", "ht", "dq", "dk", "dv", "dg", "dh0"), *outputs):
+        assert_close(name, ref, tri, 0.002)
+
+    with pytest.raises(AssertionError):
+        chunk_simple_gla(q, k, v, g, head_first=False, checkpoint_level=2)
+
+
 @pytest.mark.parametrize("N", [4])
 @pytest.mark.parametrize("T", [64, 128, 200, 250, 256, 300, 400, 512, 1000, 2048])
 @pytest.mark.parametrize("H", [4])